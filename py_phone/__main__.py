@@ -1,3 +1,10 @@
-from py_phone.py_phone import main
+import sys
 
-main()
+from py_phone import bulk
+
+if len(sys.argv) > 1 and sys.argv[1] in bulk.commands:
+    bulk.main()
+else:
+    from py_phone.py_phone import main
+
+    main()
@@ -0,0 +1,437 @@
+"""
+Benchmark of the phonebook repositories.
+
+Fill each backend with synthetic contacts and time append, get, set, pop and
+a full items() iteration, then save the results in a JSON file to compare them
+between versions.
+
+    python -m py_phone.benchmark --sizes 1000 10000 --output bench.json
+    python -m py_phone.benchmark --baseline bench.json
+"""
+
+from argparse import ArgumentParser
+import datetime
+from itertools import chain
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from py_phone.model.contact import Contact
+from py_phone.model.contact_table import ContactTable
+from py_phone.model.telephone import normalize_telephone
+from py_phone.repository.contact_binary_repository import ContactBinaryRepository
+from py_phone.repository.contact_concurrent_repository import (
+    ContactConcurrentRepository,
+)
+from py_phone.repository.contact_db_repository import ContactDbRepository
+from py_phone.repository.contact_file_repository import (
+    ContactFileFormatter,
+    ContactFileRepository,
+)
+from py_phone.repository.contact_folder_repository import (
+    ContactFolderRepository,
+    ContactShardedFolderRepository,
+)
+from py_phone.repository.contact_log_repository import ContactLogRepository
+from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+from py_phone.repository.contact_query import Condition
+from py_phone.repository.contact_repository import ContactRepository
+from py_phone.service.search_service import SearchService
+
+
+def memory_repository(folder: str) -> ContactRepository:
+    repo = ContactMemoryRepository()
+    # Don't share the class list between runs.
+    repo.phonebook = []
+    return repo
+
+
+def table_repository(folder: str) -> ContactRepository:
+    repo = ContactMemoryRepository()
+    repo.phonebook = ContactTable()
+    return repo
+
+
+backends: Dict[str, Callable[[str], ContactRepository]] = {
+    "mem": memory_repository,
+    "table": table_repository,
+    "file": lambda d: ContactFileRepository(os.path.join(d, "informazioni.txt")),
+    "log": lambda d: ContactLogRepository(os.path.join(d, "informazioni.log")),
+    "folder": lambda d: ContactFolderRepository(os.path.join(d, "informazioni")),
+    "sharded": lambda d: ContactShardedFolderRepository(
+        os.path.join(d, "informazioni")
+    ),
+    "db": lambda d: ContactDbRepository(os.path.join(d, "informazioni.db")),
+    "bin": lambda d: ContactBinaryRepository(os.path.join(d, "informazioni.bin")),
+    "concurrent": lambda d: ContactConcurrentRepository(),
+}
+"""
+Factory of each backend, given the folder where to save its data.
+"""
+
+syllables = ["ma", "ri", "lo", "ten", "to", "ni", "da", "ele", "ros", "si", "bi", "an"]
+
+
+def synthetic_contact(rnd: random.Random) -> Contact:
+    """
+    Return a random contact, the same for the same state of rnd.
+
+    >>> synthetic_contact(random.Random(0)).label()
+    'Damato Eledatoele'
+    """
+
+    def name(parts: int) -> str:
+        return "".join(rnd.choice(syllables) for _ in range(parts)).capitalize()
+
+    return Contact(
+        name(rnd.randint(2, 3)),
+        name(rnd.randint(2, 4)),
+        f"via{name(3)}{rnd.randint(1, 200)}",
+        f"3{rnd.randint(0, 999_999_999):09d}",
+        rnd.randint(1, 99),
+    )
+
+
+def summary(latencies: List[float]) -> Dict[str, float]:
+    """
+    Return throughput and percentiles, in microseconds, of the latencies.
+
+    >>> summary([0.001, 0.002, 0.003, 0.004])["p50_us"]
+    2500.0
+    """
+    total = sum(latencies)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = latencies[0] if latencies else 0.0
+
+    return {
+        "count": len(latencies),
+        "total_s": round(total, 6),
+        "ops_per_s": round(len(latencies) / total, 1) if total else 0.0,
+        "p50_us": round(p50 * 1e6, 1),
+        "p90_us": round(p90 * 1e6, 1),
+        "p99_us": round(p99 * 1e6, 1),
+        "max_us": round(max(latencies, default=0.0) * 1e6, 1),
+    }
+
+
+def timed(call: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    call()
+    return time.perf_counter() - start
+
+
+def run(backend: str, size: int, samples: int, seed: int) -> List[Dict]:
+    """
+    Benchmark a backend filled with size contacts.
+
+    :param backend: Name of the backend in backends.
+    :type backend: str
+    :param size: Number of contacts in the phonebook.
+    :type size: int
+    :param samples: Number of single operations timed for each kind.
+    :type samples: int
+    :param seed: Seed of the synthetic contacts and of the positions.
+    :type seed: int
+    :return: A result for each operation.
+    :rtype: List[Dict]
+    """
+    rnd = random.Random(seed)
+    results = []
+
+    def result(op: str, latencies: List[float], **extra) -> None:
+        results.append(
+            {"backend": backend, "size": size, "op": op, **summary(latencies), **extra}
+        )
+
+    with tempfile.TemporaryDirectory() as folder:
+        repo = backends[backend](folder)
+        fill = timed(
+            lambda: repo.append_many(synthetic_contact(rnd) for _ in range(size))
+        )
+        results.append(
+            {
+                "backend": backend,
+                "size": size,
+                "op": "fill",
+                "count": size,
+                "total_s": round(fill, 6),
+                "ops_per_s": round(size / fill, 1) if fill else 0.0,
+            }
+        )
+
+        contacts = [synthetic_contact(rnd) for _ in range(samples)]
+        result("append", [timed(lambda: repo.append(c)) for c in contacts])
+
+        n = repo.count()
+        result(
+            "get", [timed(lambda: repo.get(rnd.randrange(n))) for _ in range(samples)]
+        )
+        result("set", [timed(lambda: repo.set(rnd.randrange(n), c)) for c in contacts])
+
+        latencies = []
+        for _ in range(min(samples, n - 1)):
+            n -= 1
+            latencies.append(timed(lambda: repo.pop(rnd.randrange(n))))
+        result("pop", latencies)
+
+        items = timed(lambda: sum(1 for _ in repo.items()))
+        tracemalloc.start()
+        sum(1 for _ in repo.items())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result("items", [items], contacts_per_s=round(n / items, 1), peak_bytes=peak)
+        repo.close()
+
+    return results
+
+
+def parsers(size: int, seed: int) -> List[Dict]:
+    """
+    Compare the parsers of the text file: set on each line against decode on
+    chunks of the file.
+
+    :param size: Number of contacts in the file.
+    :type size: int
+    :param seed: Seed of the synthetic contacts.
+    :type seed: int
+    :return: A result for each parser.
+    :rtype: List[Dict]
+    """
+    rnd = random.Random(seed)
+    formatter = ContactFileFormatter()
+    data = "".join(
+        f"{formatter.format(synthetic_contact(rnd))}\n" for _ in range(size)
+    ).encode("utf-8")
+
+    def lines():
+        for line in data.splitlines():
+            if split := "".join(line.decode("utf-8").split()):
+                formatter.set(split)
+
+    def chunks():
+        step = ContactFileFormatter.chunk_size
+        for _ in formatter.decode(
+            data[i : i + step] for i in range(0, len(data), step)
+        ):
+            pass
+
+    results = []
+    for op, parse in (("set", lines), ("decode", chunks)):
+        elapsed = timed(parse)
+        results.append(
+            {
+                "backend": "parser",
+                "size": size,
+                "op": op,
+                "count": 1,
+                "total_s": round(elapsed, 6),
+                "ops_per_s": round(size / elapsed, 1) if elapsed else 0.0,
+            }
+        )
+    return results
+
+
+def stress(
+    threads: int, size: int, seed: int, seconds: float = 1.0, writes: float = 0.1
+) -> Dict:
+    """
+    Run threads that read and change the concurrent repository together for
+    some seconds, then check that no change has been lost.
+
+    Reads include lookups by telephone, queries and searches, so the indexes
+    following the changes of the repository are stressed too, and at the end
+    they must match the contacts.
+
+    Operations that fail are counted in errors instead of stopping their
+    thread. Threads share the GIL, so they show how the locks behave under
+    contention rather than a speedup.
+
+    :param threads: Number of threads.
+    :type threads: int
+    :param size: Number of contacts in the phonebook at the start.
+    :type size: int
+    :param seed: Seed of the synthetic contacts and of the operations.
+    :type seed: int
+    :param seconds: How long the threads run.
+    :type seconds: float
+    :param writes: Ratio of the operations that change the phonebook.
+    :type writes: float
+    :return: Operations done by all the threads.
+    :rtype: Dict
+    """
+    rnd = random.Random(seed)
+    repo = ContactConcurrentRepository()
+    repo.append_many(synthetic_contact(rnd) for _ in range(size))
+    search = SearchService(repo)
+    search.load()
+    contacts = [synthetic_contact(rnd) for _ in range(1000)]
+    done = [0] * threads
+    appended = [0] * threads
+    popped = [0] * threads
+    errors = [0] * threads
+    stop = threading.Event()
+
+    def work(thread: int) -> None:
+        rnd = random.Random(seed + thread)
+        while not stop.is_set():
+            op = rnd.random()
+            try:
+                if op >= writes:
+                    kind, c = rnd.random(), rnd.choice(contacts)
+                    if kind < 0.1:
+                        repo.find_by_telephone(c.telephone)
+                    elif kind < 0.2:
+                        prefix = Condition("first_name", "prefix", c.first_name[:2])
+                        repo.query([prefix])
+                    elif kind < 0.3:
+                        search.find(c.last_name[:3], 50)
+                    else:
+                        # Pick the position holding the lock, so it stays valid.
+                        with repo.lock.read():
+                            if n := repo.count():
+                                if kind < 0.9:
+                                    repo.get(rnd.randrange(n))
+                                else:
+                                    sum(1 for _ in repo.items(rnd.randrange(n), 50))
+                elif op < writes / 3:
+                    repo.append(rnd.choice(contacts))
+                    appended[thread] += 1
+                else:
+                    with repo.writing():
+                        if n := repo.count():
+                            if op < writes * 2 / 3:
+                                repo.set(rnd.randrange(n), rnd.choice(contacts))
+                            else:
+                                repo.pop(rnd.randrange(n))
+                                popped[thread] += 1
+            except Exception as e:
+                errors[thread] += 1
+                logging.error(f"Stress operation failed due to {e}")
+            done[thread] += 1
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    expected = size + sum(appended) - sum(popped)
+    if repo.count() != expected:
+        raise AssertionError(
+            f"The concurrent repository has {repo.count()} contacts instead of "
+            f"{expected}, some changes were lost"
+        )
+    saved = list(repo.items())
+    indexes = [
+        (repo.telephones, "numbers", lambda c: normalize_telephone(c.telephone)),
+        (repo.indexes, "rows", lambda c: repo.indexes.row(c)),
+        (search, "entries", search.contact_terms),
+    ]
+    for index, name, entry in indexes:
+        if index is not None and index.ready and getattr(index, name) != [entry(c) for c in saved]:
+            raise AssertionError(f"The {name} of {type(index).__name__} are wrong")
+    if sum(errors):
+        logging.warning(f"{sum(errors)} operations failed with {threads} threads")
+    return {
+        "backend": "concurrent",
+        "size": size,
+        "op": f"stress{threads}",
+        "count": sum(done),
+        "errors": sum(errors),
+        "total_s": round(elapsed, 6),
+        "ops_per_s": round(sum(done) / elapsed, 1),
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict]) -> None:
+    """
+    Print how much each operation is slower or faster than in the baseline.
+    """
+    old = {(r["backend"], r["size"], r["op"]): r for r in baseline}
+    for r in results:
+        if before := old.get((r["backend"], r["size"], r["op"])):
+            ratio = r["total_s"] / before["total_s"] if before["total_s"] else 0.0
+            print(f"{r['backend']:>8} {r['size']:>8} {r['op']:>6} x{ratio:.2f}")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark of the phonebook repositories")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=[x for x in backends],
+        default=[x for x in backends],
+    )
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default="", help="Name of the version measured")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="Results of a previous run to compare")
+    parser.add_argument(
+        "--parsers", action="store_true", help="Compare the parsers of the text file"
+    )
+    parser.add_argument(
+        "--stress",
+        type=int,
+        nargs="*",
+        metavar="THREADS",
+        help="Read and write the concurrent repository with these numbers of threads",
+    )
+    arg = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    for size in arg.sizes:
+        runs = (run(backend, size, arg.samples, arg.seed) for backend in arg.backends)
+        if arg.parsers:
+            runs = chain(runs, [parsers(size, arg.seed)])
+        if arg.stress is not None:
+            counts = arg.stress or [1, 2, 4, 8]
+            runs = chain(runs, [[stress(n, size, arg.seed) for n in counts]])
+        for rs in runs:
+            for r in rs:
+                print(
+                    f"{r['backend']:>8} {r['size']:>8} {r['op']:>6} "
+                    f"{r['ops_per_s']:>12} ops/s p99 {r.get('p99_us', '-')} us"
+                    + (f" errors {r['errors']}" if "errors" in r else "")
+                )
+                results.append(r)
+
+    with open(arg.output, "w", encoding="utf-8") as w:
+        json.dump(
+            {
+                "label": arg.label,
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "samples": arg.samples,
+                "seed": arg.seed,
+                "results": results,
+            },
+            w,
+            indent=2,
+        )
+
+    if arg.baseline:
+        with open(arg.baseline, "r", encoding="utf-8") as r:
+            compare(results, json.load(r)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Import, export and copy the contacts of the phonebook without the graphical
+interface.
+
+Contacts are streamed in chunks, so memory doesn't grow with the size of the
+dump, and a checkpoint is saved after every chunk: after an interruption, run
+the same command with --resume to continue from where it stopped.
+
+    python -m py_phone import contatti.csv db
+    python -m py_phone export file contatti.jsonl
+    python -m py_phone migrate file db --resume
+"""
+
+from argparse import ArgumentParser
+import csv
+from itertools import batched, islice
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_binary_repository import ContactBinaryRepository
+from py_phone.repository.contact_concurrent_repository import (
+    ContactConcurrentRepository,
+)
+from py_phone.repository.contact_db_repository import ContactDbRepository
+from py_phone.repository.contact_file_repository import ContactFileRepository
+from py_phone.repository.contact_folder_repository import (
+    ContactFolderRepository,
+    ContactShardedFolderRepository,
+)
+from py_phone.repository.contact_log_repository import ContactLogRepository
+from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+from py_phone.repository.contact_query import field_value
+from py_phone.repository.contact_repository import ContactRepository
+
+commands = ("import", "export", "migrate")
+"""
+Commands handled by this module instead of the graphical interface.
+"""
+
+sources: Dict[str, Callable[[], ContactRepository]] = {
+    "mem": ContactMemoryRepository,
+    "table": lambda: ContactMemoryRepository(columnar=True),
+    "file": ContactFileRepository,
+    "log": ContactLogRepository,
+    "folder": ContactFolderRepository,
+    "sharded": ContactShardedFolderRepository,
+    "db": ContactDbRepository,
+    "bin": ContactBinaryRepository,
+    "concurrent": ContactConcurrentRepository,
+    "journal": lambda: ContactMemoryRepository(journal="informazioni"),
+}
+
+storages: Dict[str, str] = {
+    "file": "informazioni.txt",
+    "log": "informazioni.log",
+    "folder": "informazioni",
+    "sharded": "informazioni",
+    "db": "informazioni.db",
+    "bin": "informazioni.bin",
+    "journal": "informazioni.snapshot",
+}
+"""
+Path where each source saves its contacts, for the ones not kept in memory.
+"""
+
+formats = ("csv", "jsonl")
+
+
+def same_storage(source: str, target: str) -> bool:
+    """
+    Tell if two sources read and write the same contacts, like the folder and
+    its sharded layout.
+
+    >>> same_storage("folder", "sharded"), same_storage("file", "db")
+    (True, False)
+    """
+    if source == target:
+        return True
+    if source not in storages or target not in storages:
+        return False
+    return os.path.realpath(storages[source]) == os.path.realpath(storages[target])
+
+
+def contact_row(c: Contact) -> Dict[str, Any]:
+    """
+    Return the fields of a contact by name, with the age as an integer.
+
+    >>> contact_row(Contact("Mario", "Rossi", "via Roma", "06 1234", "40"))
+    {'first_name': 'Mario', 'last_name': 'Rossi', 'address': 'via Roma', 'telephone': '06 1234', 'age': 40}
+    """
+    return {field: field_value(c, field) for field in Contact.__slots__}
+
+
+def row_contact(row: Dict[str, Any]) -> Contact:
+    """
+    Create a contact from its fields by name. Missing fields are empty, and an
+    age that isn't a number is None.
+
+    >>> row_contact({"first_name": "Mario", "age": "40", "other": 1})
+    Contact("Mario", "", "", "", 40)
+    """
+    fields = [str(row.get(field) or "") for field in Contact.__slots__[:4]]
+    try:
+        age = int(row.get("age"))
+    except (TypeError, ValueError):
+        age = None
+    return Contact(*fields, age)
+
+
+def file_format(path: str, format: Optional[str] = None) -> str:
+    """
+    Return the given format, or the one of the extension of path.
+
+    >>> file_format("contatti.JSONL")
+    'jsonl'
+    """
+    format = format or os.path.splitext(path)[1].lstrip(".").lower()
+    if format not in formats:
+        raise ValueError(f"Unknown format of {path}, use one of {formats}.")
+    return format
+
+
+def read_contacts(r: TextIO, format: str) -> Iterator[Contact]:
+    """
+    Read the contacts of a CSV file with a header, or of a file with a JSON
+    object on each line.
+    """
+    if format == "csv":
+        for row in csv.DictReader(r):
+            yield row_contact(row)
+        return
+
+    for line in r:
+        if line.strip():
+            yield row_contact(json.loads(line))
+
+
+def write_contacts(w: TextIO, format: str, contacts: Iterable[Contact]) -> None:
+    """
+    Write contacts in the given format. The header of a CSV file is written
+    only at the start of the file.
+    """
+    if format == "csv":
+        writer = csv.DictWriter(w, Contact.__slots__)
+        if w.tell() == 0:
+            writer.writeheader()
+        writer.writerows(contact_row(c) for c in contacts)
+        return
+
+    for c in contacts:
+        w.write(json.dumps(contact_row(c), ensure_ascii=False) + "\n")
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    """
+    Return the state saved in a checkpoint, empty if there isn't one.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as r:
+            return json.load(r)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Replace the checkpoint with state, without leaving it half written.
+    """
+    with open(f"{path}.tmp", "w", encoding="utf-8") as w:
+        json.dump(state, w)
+    os.replace(f"{path}.tmp", path)
+
+
+def resume_state(
+    path: str, resume: bool, state: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Return the state of the checkpoint if it must be resumed, None to start
+    from the beginning.
+
+    The checkpoint must be of the same command on the same data: resuming
+    another one would mix the contacts of the two.
+    """
+    if not resume:
+        return None
+    saved = load_checkpoint(path)
+    if not saved:
+        logging.warning(f"There is no checkpoint {path}, start from the beginning")
+        return None
+    if any(saved.get(k) != v for k, v in state.items()):
+        raise ValueError(f"The checkpoint {path} is of another command.")
+    return saved
+
+
+def report(verb: str, done: int, started: float, fraction: Optional[float]) -> None:
+    """
+    Log how many contacts have been copied, and how fast.
+    """
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    percent = "" if fraction is None else f" ({fraction:.0%})"
+    logging.info(f"{verb} {done} contacts{percent}, {done / elapsed:.0f} per second")
+
+
+def copy_contacts(
+    target: ContactRepository,
+    chunk: int,
+    checkpoint: str,
+    state: Dict[str, Any],
+    resume: bool,
+    skip: Callable[[int], Iterable[Contact]],
+    fraction: Callable[[int], Optional[float]],
+    verb: str,
+) -> int:
+    """
+    Append the contacts returned by skip to target, in chunks of the given size.
+
+    The checkpoint saves how many contacts target had at the start, so when
+    resuming the contacts already copied are the ones it has in more, even
+    if a chunk was only partly saved.
+
+    :param skip: Return the contacts still to copy, given how many are done.
+    :param fraction: Return the fraction of the work done, if known.
+    :return: Number of contacts copied.
+    """
+    saved = resume_state(checkpoint, resume, state)
+    start = saved["start"] if saved else target.count()
+    save_checkpoint(checkpoint, {**state, "start": start})
+
+    done = target.count() - start
+    if done:
+        logging.info(f"Resuming after {done} contacts")
+    started = time.perf_counter()
+    for batch in batched(skip(done), chunk):
+        target.append_many(batch)
+        done += len(batch)
+        report(verb, done, started, fraction(done))
+
+    os.remove(checkpoint)
+    return done
+
+
+def import_contacts(
+    input: str,
+    target: ContactRepository,
+    format: Optional[str] = None,
+    chunk: int = 10_000,
+    checkpoint: Optional[str] = None,
+    resume: bool = False,
+) -> int:
+    """
+    Append the contacts of a CSV or JSONL file to target.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> path = os.path.join(folder, "contatti.csv")
+    >>> with open(path, "w", encoding="utf-8") as w:
+    ...     _ = w.write("first_name,last_name,age\\nMario,Rossi,40\\nAnna,Bianchi,\\n")
+    >>> repo = ContactDbRepository(os.path.join(folder, "informazioni.db"))
+    >>> import_contacts(path, repo, chunk=1)
+    2
+    >>> [x for x in repo.items()]
+    [Contact("Mario", "Rossi", "", "", 40), Contact("Anna", "Bianchi", "", "", None)]
+
+    :param input: Path of the file to import.
+    :type input: str
+    :param target: Repository where to save the contacts.
+    :type target: ContactRepository
+    :param format: csv or jsonl, None to use the extension of the file.
+    :type format: Optional[str]
+    :param chunk: Number of contacts saved together.
+    :type chunk: int
+    :param checkpoint: Path of the checkpoint, by default next to input.
+    :type checkpoint: Optional[str]
+    :param resume: Continue from the checkpoint of a previous run.
+    :type resume: bool
+    :return: Number of contacts imported.
+    :rtype: int
+    """
+    format = file_format(input, format)
+    checkpoint = checkpoint or f"{input}.checkpoint"
+    size = max(os.path.getsize(input), 1)
+    with open(input, "r", encoding="utf-8", newline="") as r:
+        return copy_contacts(
+            target,
+            chunk,
+            checkpoint,
+            {"command": "import", "input": os.path.abspath(input)},
+            resume,
+            lambda done: islice(read_contacts(r, format), done, None),
+            # The buffer reads ahead, so it's a bit more than what is done.
+            lambda done: min(r.buffer.tell() / size, 1.0),
+            "Imported",
+        )
+
+
+def export_contacts(
+    source: ContactRepository,
+    output: str,
+    format: Optional[str] = None,
+    chunk: int = 10_000,
+    checkpoint: Optional[str] = None,
+    resume: bool = False,
+) -> int:
+    """
+    Write the contacts of source in a CSV or JSONL file.
+
+    When resuming, the file is cut to the size it had at the last checkpoint,
+    then the contacts after the ones written are appended.
+
+    :param source: Repository to read.
+    :type source: ContactRepository
+    :param output: Path of the file to write.
+    :type output: str
+    :return: Number of contacts exported.
+    :rtype: int
+    """
+    format = file_format(output, format)
+    checkpoint = checkpoint or f"{output}.checkpoint"
+    state = {"command": "export", "output": os.path.abspath(output)}
+    saved = resume_state(checkpoint, resume, state) or {"done": 0, "size": 0}
+    done = saved["done"]
+    if os.path.exists(output):
+        os.truncate(output, saved["size"])
+    if done:
+        logging.info(f"Resuming after {done} contacts")
+
+    total = max(source.count(), 1)
+    started = time.perf_counter()
+    with open(output, "a", encoding="utf-8", newline="") as w:
+        for batch in batched(source.items(done), chunk):
+            write_contacts(w, format, batch)
+            w.flush()
+            done += len(batch)
+            save_checkpoint(checkpoint, {**state, "done": done, "size": w.tell()})
+            report("Exported", done, started, done / total)
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return done
+
+
+def migrate_contacts(
+    source: ContactRepository,
+    target: ContactRepository,
+    chunk: int = 10_000,
+    checkpoint: str = "migrate.checkpoint",
+    resume: bool = False,
+    state: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Append all the contacts of source to target, in the order of source.
+
+    When target puts new contacts first, source is read from the end, a
+    chunk at a time, so the order is kept even when resuming.
+
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("Mario"), Contact("Anna")]
+    >>> table = ContactMemoryRepository(columnar=True)
+    >>> table.phonebook.clear()
+    >>> import tempfile
+    >>> migrate_contacts(mem, table, 1, os.path.join(tempfile.mkdtemp(), "c"))
+    2
+    >>> table.phonebook
+    ContactTable([Contact("Mario", "", "", "", None), Contact("Anna", "", "", "", None)])
+
+    :param source: Repository to read.
+    :type source: ContactRepository
+    :param target: Repository where to save the contacts.
+    :type target: ContactRepository
+    :param state: What identifies the migration in the checkpoint.
+    :type state: Optional[Dict[str, Any]]
+    :return: Number of contacts copied.
+    :rtype: int
+    """
+    count = source.count()
+    total = max(count, 1)
+
+    def skip(done: int) -> Iterable[Contact]:
+        if not target.newest_first:
+            yield from source.items(done)
+            return
+
+        for end in range(count - done, 0, -chunk):
+            start = max(end - chunk, 0)
+            yield from reversed([c for c in source.items(start, end - start)])
+
+    return copy_contacts(
+        target,
+        chunk,
+        checkpoint,
+        state or {"command": "migrate"},
+        resume,
+        skip,
+        lambda done: done / total,
+        "Copied",
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    common = ArgumentParser(add_help=False)
+    common.add_argument(
+        "--chunk",
+        type=int,
+        default=10_000,
+        metavar="N",
+        help="Salva N contatti alla volta",
+    )
+    common.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        help="File in cui salvare il punto raggiunto",
+    )
+    common.add_argument(
+        "--resume",
+        action="store_true",
+        help="Riprendi dal punto raggiunto da un'esecuzione interrotta",
+    )
+    file_options = ArgumentParser(add_help=False)
+    file_options.add_argument(
+        "--format", choices=formats, help="Formato del file, se non è nell'estensione"
+    )
+
+    parser = ArgumentParser(
+        prog="python -m py_phone",
+        description="Importa, esporta e copia i contatti della rubrica",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    command = subparsers.add_parser(
+        "import",
+        parents=[common, file_options],
+        help="Importa i contatti da un file CSV o JSONL",
+    )
+    command.add_argument("input", help="File da importare")
+    command.add_argument("target", choices=sources, help="Fonte dati da riempire")
+    command = subparsers.add_parser(
+        "export",
+        parents=[common, file_options],
+        help="Esporta i contatti in un file CSV o JSONL",
+    )
+    command.add_argument("source", choices=sources, help="Fonte dati da esportare")
+    command.add_argument("output", help="File da scrivere")
+    command = subparsers.add_parser(
+        "migrate",
+        parents=[common],
+        help="Copia i contatti da una fonte dati a un'altra",
+    )
+    command.add_argument("source", choices=sources, help="Fonte dati da leggere")
+    command.add_argument("target", choices=sources, help="Fonte dati da riempire")
+    arg = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if arg.command == "import":
+        target = sources[arg.target]()
+        try:
+            done = import_contacts(
+                arg.input, target, arg.format, arg.chunk, arg.checkpoint, arg.resume
+            )
+        finally:
+            target.close()
+    elif arg.command == "export":
+        source = sources[arg.source]()
+        try:
+            done = export_contacts(
+                source, arg.output, arg.format, arg.chunk, arg.checkpoint, arg.resume
+            )
+        finally:
+            source.close()
+    else:
+        if {arg.source, arg.target} == {"folder", "sharded"}:
+            parser.error(
+                "folder e sharded usano la stessa cartella, per dividerla in "
+                "sottocartelle usa --migrate-shards"
+            )
+        if same_storage(arg.source, arg.target):
+            parser.error("La fonte dati da leggere e quella da riempire coincidono")
+        source, target = sources[arg.source](), sources[arg.target]()
+        try:
+            done = migrate_contacts(
+                source,
+                target,
+                arg.chunk,
+                arg.checkpoint or f"migrate-{arg.source}-{arg.target}.checkpoint",
+                arg.resume,
+                {"command": "migrate", "source": arg.source, "target": arg.target},
+            )
+        finally:
+            source.close()
+            target.close()
+
+    logging.info(f"Done {arg.command} of {done} contacts")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
-from typing import Optional
+from typing import Optional, Tuple
 
 
 class Contact:
     """
     The information about a person in the phonebook.
+
+    Fields are kept in slots instead of a dictionary for each contact, to save
+    memory with big phonebooks.
     """
 
+    __slots__ = ("first_name", "last_name", "address", "telephone", "age")
+
     first_name: str
     """
     The first name of the person registered.
@@ -31,6 +36,15 @@ class Contact:
     def __repr__(self):
         return f'Contact("{self.first_name}", "{self.last_name}", "{self.address}", "{self.telephone}", {self.age})'
 
+    def fields(self) -> Tuple:
+        """
+        Return the fields of the contact, in the order of the constructor.
+
+        >>> Contact("Daniele", "Tentoni", "", "", 30).fields()
+        ('Daniele', 'Tentoni', '', '', 30)
+        """
+        return (self.first_name, self.last_name, self.address, self.telephone, self.age)
+
     def label(self):
         """
         Get the label to show in the phonebook.
@@ -0,0 +1,153 @@
+from array import array
+from collections.abc import MutableSequence
+import sys
+from typing import Iterable, List, Optional
+
+from py_phone.model.contact import Contact
+
+
+class ContactTable(MutableSequence):
+    """
+    A list of contacts saved by columns.
+
+    Each field is kept in its own list, and the age in an array of integers,
+    so the table doesn't keep an object for each contact. First and last
+    names are interned, since the same names repeat across many contacts.
+    Contacts are created again when they're read, so changing one doesn't
+    change the table.
+
+    Ages are saved as integers: a missing or empty age is read back as None.
+
+    >>> table = ContactTable([Contact("Mario", "Rossi", "via Roma", "0612", 40)])
+    >>> table.append(Contact("Luigi", "Rossi", "via Po", "0613", None))
+    >>> len(table)
+    2
+    >>> table[1]
+    Contact("Luigi", "Rossi", "via Po", "0613", None)
+    >>> table[0].last_name is table[1].last_name
+    True
+    >>> del table[0]
+    >>> [c.first_name for c in table]
+    ['Luigi']
+    """
+
+    missing_age = -1
+    """
+    Value of the age column for contacts without an age.
+    """
+
+    age_limit = 1 << (8 * array("i").itemsize - 1)
+    """
+    Ages must be less than this and at least its opposite to fit the column.
+    """
+
+    def __init__(self, contacts: Optional[Iterable[Contact]] = None):
+        """
+        Create a table, optionally with the given contacts.
+
+        :param contacts: Contacts to copy in the table.
+        :type contacts: Optional[Iterable[Contact]]
+        """
+        self.first_names: List[str] = []
+        self.last_names: List[str] = []
+        self.addresses: List[str] = []
+        self.telephones: List[str] = []
+        self.ages = array("i")
+        if contacts is not None:
+            self.extend(contacts)
+
+    def columns(self) -> List:
+        """
+        Return the columns, in the order of the fields of a contact.
+        """
+        return [
+            self.first_names,
+            self.last_names,
+            self.addresses,
+            self.telephones,
+            self.ages,
+        ]
+
+    def row(self, c: Contact) -> tuple:
+        """
+        Convert a contact to the values saved in the columns.
+
+        Ages that aren't integers, or don't fit the age column, are saved as
+        missing, like empty ones.
+
+        >>> table = ContactTable()
+        >>> table.row(Contact("Mario", age="quaranta"))[4], table.row(Contact(age=2**40))[4]
+        (-1, -1)
+        """
+        try:
+            age = int(c.age) if c.age not in ("", None) else self.missing_age
+        except ValueError:
+            age = self.missing_age
+        if not -self.age_limit <= age < self.age_limit:
+            age = self.missing_age
+        return (
+            sys.intern(str(c.first_name)),
+            sys.intern(str(c.last_name)),
+            str(c.address),
+            str(c.telephone),
+            age,
+        )
+
+    def contact(self, i: int) -> Contact:
+        """
+        Create the contact saved at the given position.
+        """
+        age = self.ages[i]
+        return Contact(
+            self.first_names[i],
+            self.last_names[i],
+            self.addresses[i],
+            self.telephones[i],
+            None if age == self.missing_age else age,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ages)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.contact(j) for j in range(len(self))[i]]
+        return self.contact(i)
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            rows = [self.row(c) for c in value]
+            values = [list(x) for x in zip(*rows)] if rows else [[]] * 5
+            for column, column_values in zip(self.columns()[:4], values):
+                column[i] = column_values
+            self.ages[i] = array("i", values[4])
+            return
+
+        for column, v in zip(self.columns(), self.row(value)):
+            column[i] = v
+
+    def __delitem__(self, i):
+        for column in self.columns():
+            del column[i]
+
+    def __iter__(self):
+        for first, last, address, telephone, age in zip(*self.columns()):
+            yield Contact(
+                first,
+                last,
+                address,
+                telephone,
+                None if age == self.missing_age else age,
+            )
+
+    def __repr__(self):
+        return f"ContactTable({list(self)})"
+
+    def insert(self, i: int, value: Contact) -> None:
+        for column, v in zip(self.columns(), self.row(value)):
+            column.insert(i, v)
+
+    def extend(self, values: Iterable[Contact]) -> None:
+        rows = [self.row(c) for c in values]
+        for column, column_values in zip(self.columns(), zip(*rows)):
+            column.extend(column_values)
@@ -0,0 +1,66 @@
+"""
+Compare telephone numbers written in different ways.
+"""
+
+country_code = "39"
+"""
+Country code dropped from international numbers, to compare them with the
+national ones.
+"""
+
+suffix_length = 7
+"""
+Number of final digits that must be the same for two numbers to match when
+one is longer than the other.
+"""
+
+
+def normalize_telephone(number: str) -> str:
+    """
+    Return only the digits of a telephone number, without the international
+    prefix of the local country.
+
+    >>> normalize_telephone("+39 06 1234 567")
+    '061234567'
+    >>> normalize_telephone("0039-333.123.4567")
+    '3331234567'
+    >>> normalize_telephone("+44 20 7946 0018")
+    '442079460018'
+    """
+    number = str(number).strip()
+    digits = "".join(x for x in number if x in "0123456789")
+    international = number.startswith("+")
+    if not international and digits.startswith("00"):
+        digits = digits[2:]
+        international = True
+    if international and digits.startswith(country_code):
+        digits = digits[len(country_code) :]
+    return digits
+
+
+def telephone_key(number: str) -> str:
+    """
+    Return the final digits of a normalized number, the same for all the
+    numbers that can match it.
+
+    >>> telephone_key("061234567")
+    '1234567'
+    """
+    return number[-suffix_length:]
+
+
+def telephones_match(a: str, b: str) -> bool:
+    """
+    Tell if two normalized numbers are the same, or one ends with the other
+    and they share at least suffix_length digits.
+
+    >>> telephones_match("3331234567", "393331234567")
+    True
+    >>> telephones_match("4567", "1234567")
+    False
+    """
+    if a == b:
+        return True
+    if min(len(a), len(b)) < suffix_length:
+        return False
+    return a.endswith(b) or b.endswith(a)
@@ -3,16 +3,37 @@ Phonebook project
 """
 
 from argparse import ArgumentParser
+import cProfile
 import logging
+import pstats
 import sys
+import tracemalloc
 from tkinter import Event, Toplevel, messagebox
-from typing import Optional
+from typing import List, Optional, Tuple
 import tkinter
 
-from py_phone.repository.contact_folder_repository import ContactFolderRepository
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_binary_repository import ContactBinaryRepository
+from py_phone.repository.contact_caching_repository import CachingContactRepository
+from py_phone.repository.contact_concurrent_repository import (
+    ContactConcurrentRepository,
+)
+from py_phone.repository.contact_db_repository import ContactDbRepository
+from py_phone.repository.contact_folder_repository import (
+    ContactFolderRepository,
+    ContactShardedFolderRepository,
+)
+from py_phone.repository.contact_instrumented_repository import (
+    InstrumentedContactRepository,
+)
+from py_phone.repository.contact_log_repository import ContactLogRepository
 from py_phone.repository.contact_memory_repository import ContactMemoryRepository
-from py_phone.repository.contact_repository import ContactRepository
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
 from py_phone.repository.contact_file_repository import ContactFileRepository
+from py_phone.repository.write_buffer import fsync_policies
+from py_phone.service.phonebook_service import PhonebookService
+from py_phone.service.search_service import SearchService
+from py_phone.utils import control
 from py_phone.windows.details_window import DetailContactWindow
 from py_phone.windows.login_window import LoginWindow
 
@@ -22,17 +43,61 @@ logging.basicConfig(level=logging.INFO)
 class App:
     """
     The main application for tkinter.
+
+    The table loads the phonebook a page at a time, when the user scrolls
+    near the end of the rows already loaded. Afterwards it's patched row by
+    row with the changes notified by the phonebook.
+
+    The phonebook is only accessed through a PhonebookService, so reads and
+    writes run on its worker thread and the window never waits for them.
+
+    Typing in the search field replaces the table with the contacts found by
+    a SearchService, until the field is emptied.
+
+    Every watch seconds the phonebook is asked for the changes made by someone
+    else, which patch the table like the others.
+    """
+
+    page_size = 100
+    """
+    Number of contacts loaded in the table at a time.
     """
 
-    def __init__(self, root: tkinter.Tk, phonebook: ContactRepository):
+    def __init__(
+        self, root: tkinter.Tk, phonebook: ContactRepository, watch: float = 0.0
+    ):
         self.root = root
         self.root.title("Phonebook")
 
         self.phonebook = phonebook
+        self.service = PhonebookService(root, phonebook)
+        self.loaded = 0
+        self.exhausted = False
+        self.loading = False
+        self.generation = 0
+        """
+        Incremented on every full reload, to drop pages of older loads.
+        """
+
+        self.search = SearchService(phonebook)
+        self.searches = 0
+        self.rows: Optional[List[int]] = None
+        """
+        Position in the phonebook of each row, while showing search results.
+        """
+
+        # Ricerca
+        self.ent_search = control(root, "Cerca > ", 3)
+        self.ent_search.bind("<KeyRelease>", self.search_contacts)
 
         # Tabella
         self.table = tkinter.Listbox(root, width=50)
         self.table.grid(row=5, column=0, columnspan=3, padx=10, pady=5)
+        self.scrollbar = tkinter.Scrollbar(
+            root, orient=tkinter.VERTICAL, command=self.table.yview
+        )
+        self.scrollbar.grid(row=5, column=3, sticky="ns", pady=5)
+        self.table.configure(yscrollcommand=self.scroll_phonelist)
 
         # Controlli
         self.btn_add = tkinter.Button(root, text="Nuovo", command=self.new_contact)
@@ -48,12 +113,19 @@ class App:
         )
         self.btn_delete.grid(row=4, column=2, padx=5, pady=5)
 
+        self.lbl_status = tkinter.Label(root, text="")
+        self.lbl_status.grid(row=6, column=0, columnspan=3, padx=5, pady=5)
+
+        self.service.subscribe(self.change_phonelist)
+        if watch > 0:
+            # Before any read, so the phonebook knows what the table shows.
+            self.service.watch(int(watch * 1000))
+        self.service.submit(self.search.load)
         self.update_phonelist(self.root)
 
     def new_contact(self):
         top_create = Toplevel(self.root)
-        top_create.bind("<Destroy>", lambda e: self.update_phonelist(e))
-        DetailContactWindow(top_create, self.phonebook)
+        DetailContactWindow(top_create, self.service)
 
     def update_contact(self):
         """
@@ -61,9 +133,8 @@ class App:
         """
         if selected := self.table.curselection():
             top_update = Toplevel(self.root)
-            top_update.bind("<Destroy>", lambda e: self.update_phonelist(e))
-            i = selected[0]
-            DetailContactWindow(top_update, self.phonebook, i)
+            i = self.position(selected[0])
+            DetailContactWindow(top_update, self.service, i)
         else:
             messagebox.showerror(
                 "Errore", "Devi prima selezionare un contatto da modificare"
@@ -71,15 +142,25 @@ class App:
 
     def delete_contact(self):
         if selected := self.table.curselection():
-            i = selected[0]
-            elem = self.phonebook.get(i)
-            if messagebox.askyesno(
-                "Cancella contatto",
-                f"Sei sicuro di voler cancellare il contatto {elem.label()}?",
-            ):
-                destroyed = self.phonebook.pop(i)
-                logging.info(f"Destroyed {destroyed.first_name} at {i}")
-                self.update_phonelist()
+            i = self.position(selected[0])
+
+            def confirm(elem: Contact):
+                if messagebox.askyesno(
+                    "Cancella contatto",
+                    f"Sei sicuro di voler cancellare il contatto {elem.label()}?",
+                ):
+                    self.service.pop(
+                        i,
+                        lambda d: logging.info(f"Destroyed {d.first_name} at {i}"),
+                    )
+
+            self.service.get(
+                i,
+                confirm,
+                lambda e: messagebox.showerror(
+                    "Errore", f"Non riesco a leggere il contatto: {e}"
+                ),
+            )
         else:
             messagebox.showwarning(
                 "Errore", "Seleziona almeno un contatto da eliminare."
@@ -103,16 +184,144 @@ class App:
                     return
 
         self.table.delete(0, tkinter.END)
-        for c in self.phonebook.items():
-            self.table.insert(tkinter.END, f"{c.label()}")
+        self.loaded = 0
+        self.exhausted = False
+        self.generation += 1
+        self.load_page()
+
+    def change_phonelist(self, change: ContactChange, id: int, c: Contact):
+        """
+        Patch the row of a contact changed in the phonebook.
+
+        Rows after the loaded ones are left to the next page. While showing
+        search results, the search is done again.
+        """
+        if self.rows is not None:
+            self.search_contacts()
+            return
+
+        if change == ContactChange.INSERTED:
+            if id < self.loaded or (id == self.loaded and self.exhausted):
+                self.table.insert(id, c.label())
+                self.loaded += 1
+        elif id < self.loaded:
+            selected = self.table.curselection()
+            self.table.delete(id)
+            if change == ContactChange.UPDATED:
+                self.table.insert(id, c.label())
+                if id in selected:
+                    self.table.selection_set(id)
+            else:
+                self.loaded -= 1
+
+    def load_page(self):
+        """
+        Ask the next page of contacts, appended to the table when it's read.
+        """
+        if self.exhausted or self.loading:
+            return
+
+        self.loading = True
+        self.lbl_status.config(text="Caricamento...")
+        offset = self.loaded
+        generation = self.generation
+        self.service.page(
+            offset, self.page_size, lambda p: self.show_page(generation, offset, p)
+        )
+
+    def show_page(self, generation: int, offset: int, page: List[Contact]):
+        """
+        Append a page of contacts read from the phonebook to the table.
+        """
+        self.loading = False
+        if self.rows is not None:
+            # Search results are shown, the page is loaded again later.
+            return
+        if generation != self.generation or offset != self.loaded:
+            # The table changed while reading, the page is stale.
+            self.load_page()
+            return
+
+        labels = [f"{c.label()}" for c in page]
+        if labels:
+            self.table.insert(tkinter.END, *labels)
+        self.loaded += len(labels)
+        self.exhausted = len(labels) < self.page_size
+        self.lbl_status.config(text="")
+        logging.debug("Loaded %d contacts in the table", self.loaded)
+
+    def scroll_phonelist(self, first: str, last: str):
+        """
+        Move the scrollbar with the table, loading more rows near the end.
+        """
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and self.rows is None:
+            self.load_page()
+
+    def position(self, row: int) -> int:
+        """
+        Return the position in the phonebook of a row of the table.
+        """
+        return row if self.rows is None else self.rows[row]
+
+    def search_contacts(self, e: Optional[Event] = None):
+        """
+        Show the contacts matching the text in the search field, or all of
+        them again if it's empty.
+        """
+        query = self.ent_search.get()
+        if not query.strip():
+            if self.rows is not None:
+                self.rows = None
+                self.update_phonelist()
+            return
+
+        self.searches += 1
+        search = self.searches
+        self.service.submit(
+            lambda: self.search.find(query, self.page_size),
+            lambda found: self.show_results(search, found),
+        )
+
+    def show_results(self, search: int, found: List[Tuple[int, Contact]]):
+        """
+        Replace the rows of the table with the results of a search.
+        """
+        if search != self.searches or not self.ent_search.get().strip():
+            return
+
+        self.rows = [id for id, _ in found]
+        self.table.delete(0, tkinter.END)
+        if found:
+            self.table.insert(tkinter.END, *[c.label() for _, c in found])
+        self.lbl_status.config(text=f"{len(found)} risultati")
 
 
 def main():
     sources = {
         "mem": ContactMemoryRepository,
-        "file": ContactFileRepository,
-        "folder": ContactFolderRepository,
-        "db": ContactRepository,
+        "table": lambda: ContactMemoryRepository(columnar=True),
+        "file": lambda: ContactFileRepository(
+            processes=arg.processes,
+            buffer_size=arg.buffer,
+            buffer_delay=arg.buffer_delay,
+            fsync=arg.fsync,
+        ),
+        "log": ContactLogRepository,
+        "folder": lambda: ContactFolderRepository(
+            buffer_size=arg.buffer, buffer_delay=arg.buffer_delay, fsync=arg.fsync
+        ),
+        "sharded": lambda: ContactShardedFolderRepository(
+            buffer_size=arg.buffer, buffer_delay=arg.buffer_delay, fsync=arg.fsync
+        ),
+        "db": ContactDbRepository,
+        "bin": ContactBinaryRepository,
+        "concurrent": ContactConcurrentRepository,
+        "journal": lambda: ContactMemoryRepository(
+            journal="informazioni",
+            snapshot_every=arg.snapshot_every,
+            fsync=arg.fsync,
+        ),
     }
     if len(sources) < 1:
         logging.error("There are no repositories configured for phonebook")
@@ -126,9 +335,97 @@ def main():
         nargs="?",
         default="mem",
     )
+    parser.add_argument(
+        "--migrate-shards",
+        action="store_true",
+        help="Sposta i contatti della cartella informazioni in sottocartelle ed esce",
+    )
+    parser.add_argument(
+        "--cache",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Tieni in memoria fino a N contatti letti dalla rubrica",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Usa N processi per leggere un file informazioni.txt molto grande",
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=10_000,
+        metavar="N",
+        help="Con la fonte journal, salva uno snapshot ogni N modifiche",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=fsync_policies,
+        default="batch",
+        help="Quando forzare la scrittura su disco: mai, a ogni blocco o a ogni "
+        "scrittura",
+    )
+    parser.add_argument(
+        "--buffer",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Con le fonti file, folder e sharded, scrivi i nuovi contatti a N alla "
+        "volta",
+    )
+    parser.add_argument(
+        "--buffer-delay",
+        type=float,
+        default=0.0,
+        metavar="S",
+        help="Scrivi i nuovi contatti in attesa nel buffer dopo al massimo S secondi",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=1.0,
+        metavar="S",
+        help="Controlla ogni S secondi le modifiche fatte da altri programmi alla "
+        "rubrica, 0 per non controllare",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Misura le operazioni sulla rubrica e stampa un resoconto in uscita",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Salva in FILE il profilo cProfile dell'applicazione",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Traccia la memoria allocata e stampa le righe che ne usano di più",
+    )
     arg = parser.parse_args()
+    if arg.migrate_shards:
+        moved = ContactShardedFolderRepository().migrate_to_shards()
+        logging.info(f"Migrated {moved} contacts to the sharded folder")
+        return
+
     logging.info(f"Using {arg.source} as source for the phonebook")
+    if arg.tracemalloc:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if arg.profile else None
+    if profiler:
+        # Since Python 3.12 it profiles the phonebook worker thread too.
+        profiler.enable()
+
     phonebook: ContactRepository = sources.get(str(arg.source))()
+    instrumented = None
+    if arg.stats:
+        phonebook = instrumented = InstrumentedContactRepository(phonebook)
+    if arg.cache > 0:
+        phonebook = CachingContactRepository(phonebook, arg.cache)
 
     widget = tkinter.Tk()
     widget.withdraw()
@@ -137,10 +434,35 @@ def main():
     widget.wait_window(top_login)
     if login_window.success:
         widget.deiconify()
-        App(widget, phonebook)
+        app = App(widget, phonebook, arg.watch)
         widget.mainloop()
+        app.service.close()
+        phonebook.close()
+        if isinstance(phonebook, CachingContactRepository):
+            logging.info(
+                f"Cache hits {phonebook.hits}, misses {phonebook.misses}, "
+                f"ratio {phonebook.hit_ratio():.2f}"
+            )
     else:
         messagebox.showerror("Error", "Your login as failed, restart the app")
+        phonebook.close()
+
+    if instrumented:
+        logging.info(f"Phonebook operations:\n{instrumented.report()}")
+        logging.info(
+            f"Bytes read {instrumented.phonebook.bytes_read}, "
+            f"written {instrumented.phonebook.bytes_written}"
+        )
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(arg.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    if arg.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        logging.info(f"Memory used {current} bytes, peak {peak} bytes")
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]:
+            logging.info(f"{stat}")
+        tracemalloc.stop()
 
     logging.info("I'm going to close the application")
 
@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+from typing import Dict, Optional, Set
+
+watched_events = 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+"""
+Inotify events watched: a file closed after writing, moved away or in,
+created and removed.
+"""
+
+moved_from = 0x040
+moved_to = 0x080
+created = 0x100
+queue_overflow = 0x4000
+ignored = 0x8000
+is_dir = 0x40000000
+
+header = struct.Struct("iIII")
+"""
+Watch descriptor, mask, cookie and name length of an inotify event.
+"""
+
+
+class ChangeWatcher:
+    """
+    Tell which files inside a folder and its subfolders changed, with inotify.
+
+    Every folder is watched, and new subfolders are watched as soon as they
+    are seen, reporting the files already inside them. Where inotify isn't
+    available, as outside Linux, available is False and the caller has to
+    look at the files by itself.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> watcher = ChangeWatcher(folder)
+    >>> os.makedirs(os.path.join(folder, "ab", "cd"))
+    >>> open(os.path.join(folder, "ab", "cd", "primo.txt"), "w").close()
+    >>> sorted(watcher.changes()) if watcher.available else ["ab/cd/primo.txt"]
+    ['ab/cd/primo.txt']
+    >>> watcher.changes() if watcher.available else set()
+    set()
+    >>> watcher.close()
+    """
+
+    def __init__(self, folder: str):
+        """
+        Start watching a folder.
+
+        :param folder: Path of the folder.
+        :type folder: str
+        """
+        self.folder = folder
+        self.folders: Dict[int, str] = {}
+        """
+        Path relative to folder of each watch descriptor.
+        """
+
+        self.fd: Optional[int] = None
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError, TypeError):
+            fd = -1
+        if fd < 0:
+            logging.info(f"Can't use inotify, {folder} will be polled")
+            return
+
+        self.fd = fd
+        self.watch("", None)
+
+    @property
+    def available(self) -> bool:
+        return self.fd is not None
+
+    def watch(self, folder: str, found: Optional[Set[str]]) -> None:
+        """
+        Watch a folder relative to the watched one and its subfolders.
+
+        :param folder: Path of the folder, relative to the watched one.
+        :type folder: str
+        :param found: Set where to add the files already inside, None to skip them.
+        :type found: Optional[Set[str]]
+        """
+        path = os.path.join(self.folder, folder)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), watched_events)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error != errno.ENOENT:
+                logging.warning(
+                    f"Can't watch {path} due to {os.strerror(error)}, polling instead"
+                )
+                self.close()
+            return
+
+        self.folders[wd] = folder
+        try:
+            with os.scandir(path) as entries:
+                entries = [(e.name, e.is_dir()) for e in entries]
+        except FileNotFoundError:
+            return
+
+        for name, directory in entries:
+            name = f"{folder}/{name}" if folder else name
+            if directory:
+                self.watch(name, found)
+                if self.fd is None:
+                    return
+            elif found is not None:
+                found.add(name)
+
+    def changes(self) -> Optional[Set[str]]:
+        """
+        Return the files created, written, moved or removed since the last
+        call, relative to the folder, None if the watcher can't tell them.
+        """
+        if self.fd is None:
+            return None
+
+        changed: Set[str] = set()
+        lost = False
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = header.unpack_from(data, offset)
+                offset += header.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & ignored:
+                    self.folders.pop(wd, None)
+                    continue
+                folder = self.folders.get(wd)
+                if mask & queue_overflow or folder is None:
+                    lost = lost or bool(mask & queue_overflow)
+                    continue
+
+                path = f"{folder}/{name}" if folder else name
+                if not mask & is_dir:
+                    changed.add(path)
+                elif mask & moved_from:
+                    # The files inside moved away without an event each.
+                    lost = True
+                elif mask & (created | moved_to):
+                    self.watch(path, changed)
+                    if self.fd is None:
+                        return None
+
+        return None if lost else changed
+
+    def close(self) -> None:
+        """
+        Stop watching the folder.
+        """
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        self.folders.clear()
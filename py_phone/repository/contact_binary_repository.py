@@ -0,0 +1,482 @@
+from array import array
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+
+
+class ContactBinaryRepository(ContactRepository):
+    """
+    Save contacts in a binary file of length-prefixed records.
+
+    The file starts with a fixed header, followed by the records. Each record
+    is framed by its length and kind, then holds the key of the contact, the
+    age and the four strings, each prefixed by its length, so any character
+    can be saved and a record is decoded without searching separators.
+
+    Like the log, an update appends a new version of the record with the same
+    key and a delete only flags the record, so the file is never rewritten.
+    Contacts are in the order of their keys. flush() appends a table with the
+    offset of every live record and points the header to it, so the next open
+    reads the table instead of scanning the whole file. The table is stale as
+    soon as the file is changed again, and it's then ignored until the next
+    flush. Records are read through a memory map of the file.
+
+    >>> import tempfile
+    >>> repo = ContactBinaryRepository(os.path.join(tempfile.mkdtemp(), "informazioni.bin"))
+    >>> repo.append(Contact("primo", "secondo", "via~terzo", "quarto", 5))
+    0
+    >>> repo.append(Contact("quinto", "sesto", "settimo", "ottavo", None))
+    1
+    >>> repo.set(0, Contact("nono", "decimo", "undicesimo", "dodicesimo", 12))
+    >>> repo.pop(1)
+    Contact("quinto", "sesto", "settimo", "ottavo", None)
+    >>> repo.close()
+    >>> reopened = ContactBinaryRepository(repo.file)
+    >>> [x for x in reopened.items()]
+    [Contact("nono", "decimo", "undicesimo", "dodicesimo", 12)]
+    >>> reopened.close()
+    """
+
+    magic = b"PYPB"
+    version = 1
+
+    header = struct.Struct("<4sHHQQ")
+    """
+    Magic, version, unused flags, offset of the table or 0 if stale, number of
+    records in the table.
+    """
+
+    frame = struct.Struct("<IB")
+    """
+    Length of the record after the frame and kind of the record.
+    """
+
+    fields = struct.Struct("<Qi")
+    """
+    Key and age of a contact, -1 if the age is missing.
+    """
+
+    length = struct.Struct("<H")
+    """
+    Length in bytes of a string.
+    """
+
+    entry = struct.Struct("<QQ")
+    """
+    Key and offset of a live record in the table.
+    """
+
+    contact_kind = 0
+    deleted_kind = 1
+    table_kind = 2
+
+    def __init__(self, file: str = "informazioni.bin"):
+        """
+        Open the binary file, creating it if missing.
+
+        :param file: Path of the binary file.
+        :type file: str
+        """
+        super().__init__()
+        self.file = file
+        if not os.path.isfile(self.file) or os.path.getsize(self.file) == 0:
+            with open(self.file, "wb") as w:
+                w.write(self.header.pack(self.magic, self.version, 0, 0, 0))
+
+        self.lock = threading.RLock()
+        self.handle = open(self.file, "r+b")
+        self.map: Optional[mmap.mmap] = None
+        self.size = 0
+        self.table_offset = 0
+
+        self.keys = array("Q")
+        """
+        Keys of the live records, in the order of the contacts.
+        """
+
+        self.offsets = array("Q")
+        """
+        Offset of the live record of each contact.
+        """
+
+        self.records = 0
+        """
+        Number of contact records in the file, dead ones included. When the
+        offsets are read from the table, dead records before it aren't known.
+        """
+
+        self.next_key = 0
+        self.signature: Optional[Tuple[int, int]] = None
+
+    def stat_signature(self) -> Tuple[int, int]:
+        """
+        Return modification time and size of the file, used to detect changes.
+        """
+        stat = os.stat(self.file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def view(self) -> mmap.mmap:
+        """
+        Return a memory map of the whole file, mapping it again if it grew.
+        """
+        if self.map is None or len(self.map) < self.size:
+            self.map = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def load(self) -> None:
+        """
+        Read again the offsets of the records if the file changed since the
+        last time, from the table if it's up to date or scanning the records.
+        """
+        with self.lock:
+            signature = self.stat_signature()
+            if signature == self.signature:
+                return
+
+            if self.signature is not None:
+                # The file may have been replaced by someone else.
+                self.handle.close()
+                self.handle = open(self.file, "r+b")
+            self.size = signature[1]
+            self.map = None
+            view = self.view()
+            magic, version, _, table, count = self.header.unpack_from(view, 0)
+            if magic != self.magic:
+                raise ValueError(f"{self.file} is not a phonebook binary file.")
+            if version > self.version:
+                raise ValueError(f"Unknown version {version} of {self.file}.")
+
+            self.table_offset = table
+            if not (table and self.load_table(view, table, count)):
+                self.scan(view)
+            self.signature = self.stat_signature()
+
+    def load_table(self, view: mmap.mmap, table: int, count: int) -> bool:
+        """
+        Read the offsets of the records from the table.
+
+        :return: False if the table isn't the end of the file.
+        :rtype: bool
+        """
+        if table + self.frame.size > self.size:
+            return False
+        length, kind = self.frame.unpack_from(view, table)
+        start = table + self.frame.size
+        if kind != self.table_kind or start + length != self.size:
+            return False
+        if length != count * self.entry.size:
+            return False
+
+        keys, offsets = array("Q"), array("Q")
+        for key, offset in self.entry.iter_unpack(view[start : start + length]):
+            keys.append(key)
+            offsets.append(offset)
+
+        self.bytes_read += length
+        self.keys, self.offsets = keys, offsets
+        self.records = count
+        self.next_key = keys[-1] + 1 if keys else 0
+        logging.info(f"Loaded {count} contacts from the table of {self.file}")
+        return True
+
+    def scan(self, view: mmap.mmap) -> None:
+        """
+        Read the offsets of the records scanning the whole file.
+
+        A record cut by a crash at the end of the file is truncated away.
+        """
+        live: Dict[int, int] = {}
+        records = 0
+        offset = self.header.size
+        while offset + self.frame.size <= self.size:
+            length, kind = self.frame.unpack_from(view, offset)
+            end = offset + self.frame.size + length
+            if end > self.size:
+                break
+            if kind == self.contact_kind:
+                (key,) = struct.unpack_from("<Q", view, offset + self.frame.size)
+                # A later version wins over one not flagged before a crash.
+                live[key] = offset
+                self.next_key = max(self.next_key, key + 1)
+                records += 1
+            elif kind == self.deleted_kind:
+                records += 1
+            offset = end
+
+        self.bytes_read += offset
+        if offset < self.size:
+            logging.error(f"Truncating broken record at {offset} of {self.file}")
+            self.map = None
+            self.handle.truncate(offset)
+            self.size = offset
+
+        ordered = sorted(live)
+        self.keys = array("Q", ordered)
+        self.offsets = array("Q", (live[k] for k in ordered))
+        self.records = records
+        logging.info(f"Scanned {len(live)} contacts of {records} records")
+
+    def encode(self, key: int, c: Contact) -> bytes:
+        """
+        Convert a contact to a record, frame included.
+        """
+        age = int(c.age) if c.age not in ("", None) else -1
+        parts = [self.fields.pack(key, age)]
+        for value in (c.first_name, c.last_name, c.address, c.telephone):
+            data = str(value).encode("utf-8")
+            if len(data) > 0xFFFF:
+                raise ValueError("A field of the contact is longer than 65535 bytes.")
+            parts.append(self.length.pack(len(data)))
+            parts.append(data)
+
+        payload = b"".join(parts)
+        return self.frame.pack(len(payload), self.contact_kind) + payload
+
+    def decode(self, view: mmap.mmap, offset: int) -> Contact:
+        """
+        Convert the record at the given offset to a contact.
+        """
+        length, _ = self.frame.unpack_from(view, offset)
+        self.bytes_read += self.frame.size + length
+        position = offset + self.frame.size
+        _, age = self.fields.unpack_from(view, position)
+        position += self.fields.size
+        strings = []
+        for _ in range(4):
+            (n,) = self.length.unpack_from(view, position)
+            position += self.length.size
+            strings.append(view[position : position + n].decode("utf-8"))
+            position += n
+
+        return Contact(*strings, None if age < 0 else age)
+
+    def write(self, data: bytes) -> int:
+        """
+        Append data at the end of the file, marking the table as stale.
+
+        :return: Offset of the data.
+        :rtype: int
+        """
+        self.stale()
+        offset = self.handle.seek(0, os.SEEK_END)
+        self.handle.write(data)
+        self.handle.flush()
+        self.bytes_written += len(data)
+        self.size = offset + len(data)
+        return offset
+
+    def kill(self, offset: int) -> None:
+        """
+        Flag the record at the given offset as deleted.
+        """
+        self.stale()
+        self.handle.seek(offset + self.frame.size - 1)
+        self.handle.write(bytes([self.deleted_kind]))
+        self.handle.flush()
+        self.bytes_written += 1
+
+    def stale(self) -> None:
+        """
+        Clear the table offset in the header before the first change after a
+        flush, so the table isn't trusted anymore.
+        """
+        if self.table_offset:
+            self.handle.seek(0)
+            self.handle.write(self.header.pack(self.magic, self.version, 0, 0, 0))
+            self.table_offset = 0
+
+    def synced(self) -> None:
+        """
+        Remember the file as changed only by this repository.
+        """
+        self.signature = self.stat_signature()
+
+    def append(self, c: Contact) -> int:
+        with self.lock:
+            self.load()
+            key = self.next_key
+            self.next_key += 1
+            offset = self.write(self.encode(key, c))
+            self.keys.append(key)
+            self.offsets.append(offset)
+            self.records += 1
+            self.synced()
+            index = len(self.keys) - 1
+            logging.debug("Appended contact %s at %d", c.label(), index)
+            c = self.decode(self.view(), offset)
+            self.notify(ContactChange.INSERTED, index, c)
+            return index
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        stop = None if limit is None else offset + limit
+        with self.lock:
+            self.load()
+            offsets = self.offsets[offset:stop]
+            view = self.view()
+
+        for offset in offsets:
+            yield self.decode(view, offset)
+
+    def count(self) -> int:
+        with self.lock:
+            self.load()
+            return len(self.keys)
+
+    def pop(self, id: int) -> Contact:
+        with self.lock:
+            self.load()
+            id = range(len(self.keys))[id]
+            c = self.decode(self.view(), self.offsets[id])
+            self.kill(self.offsets[id])
+            del self.keys[id]
+            del self.offsets[id]
+            self.synced()
+            self.notify(ContactChange.REMOVED, id, c)
+            return c
+
+    def get(self, id: int) -> Contact:
+        with self.lock:
+            self.load()
+            return self.decode(self.view(), self.offsets[id])
+
+    def set(self, id: int, c: Contact):
+        with self.lock:
+            self.load()
+            id = range(len(self.keys))[id]
+            old = self.offsets[id]
+            self.offsets[id] = self.write(self.encode(self.keys[id], c))
+            self.kill(old)
+            self.records += 1
+            self.synced()
+            c = self.decode(self.view(), self.offsets[id])
+            self.notify(ContactChange.UPDATED, id, c)
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        with self.lock:
+            self.load()
+            start = len(self.keys)
+            records = []
+            for c in contacts:
+                records.append(self.encode(self.next_key, c))
+                self.keys.append(self.next_key)
+                self.next_key += 1
+
+            offset = self.write(b"".join(records))
+            for record in records:
+                self.offsets.append(offset)
+                offset += len(record)
+            self.records += len(records)
+            self.synced()
+
+            view = self.view()
+            logging.info(f"Appended {len(records)} contacts at {start}")
+            for i in range(start, len(self.keys)):
+                c = self.decode(view, self.offsets[i])
+                self.notify(ContactChange.INSERTED, i, c)
+            return [i for i in range(start, len(self.keys))]
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        with self.lock:
+            self.load()
+            positions = range(len(self.keys))
+            changes = {positions[id]: c for id, c in dict(changes).items()}
+            records = [self.encode(self.keys[id], c) for id, c in changes.items()]
+            offset = self.write(b"".join(records))
+            for id, record in zip(changes, records):
+                self.kill(self.offsets[id])
+                self.offsets[id] = offset
+                offset += len(record)
+            self.records += len(records)
+            self.synced()
+
+            view = self.view()
+            for id in changes:
+                c = self.decode(view, self.offsets[id])
+                self.notify(ContactChange.UPDATED, id, c)
+
+    def garbage(self) -> int:
+        """
+        Return the number of dead records in the file.
+        """
+        return self.records - len(self.keys)
+
+    def flush(self) -> None:
+        """
+        Append the table of the live records and point the header to it, if
+        the file changed since the last table.
+        """
+        with self.lock:
+            self.load()
+            if self.table_offset:
+                return
+
+            table = b"".join(
+                self.entry.pack(key, offset)
+                for key, offset in zip(self.keys, self.offsets)
+            )
+            offset = self.write(self.frame.pack(len(table), self.table_kind) + table)
+            self.handle.seek(0)
+            self.handle.write(
+                self.header.pack(self.magic, self.version, 0, offset, len(self.keys))
+            )
+            self.handle.flush()
+            self.table_offset = offset
+            self.synced()
+
+    def compact(self) -> None:
+        """
+        Rewrite the file with only the live records, followed by their table.
+        """
+        temp = f"{self.file}.compact"
+        with self.lock:
+            self.load()
+            view = self.view()
+            keys, offsets = array("Q"), array("Q")
+            with open(temp, "wb") as w:
+                w.write(self.header.pack(self.magic, self.version, 0, 0, 0))
+                for key, offset in zip(self.keys, self.offsets):
+                    length, _ = self.frame.unpack_from(view, offset)
+                    end = offset + self.frame.size + length
+                    keys.append(key)
+                    offsets.append(w.tell())
+                    w.write(view[offset:end])
+
+                size = w.tell()
+                self.bytes_read += size
+                self.bytes_written += size
+
+            self.map = None
+            self.handle.close()
+            os.replace(temp, self.file)
+            self.handle = open(self.file, "r+b")
+            self.keys, self.offsets = keys, offsets
+            self.records = len(keys)
+            self.size = size
+            self.table_offset = 0
+            self.synced()
+            logging.info(f"Compacted {self.file} to {len(keys)} records")
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Save the table, compacting the file first if most records are dead,
+        and close the file.
+        """
+        with self.lock:
+            if self.handle.closed:
+                return
+
+            if self.garbage() > len(self.keys):
+                self.compact()
+            else:
+                self.flush()
+            self.map = None
+            self.handle.close()
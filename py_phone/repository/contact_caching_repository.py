@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from itertools import islice
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_query import Condition
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+
+
+class CachingContactRepository(ContactRepository):
+    """
+    Cache the contacts read from another repository.
+
+    Single contacts are kept in a bounded LRU cache, and the list read by a
+    full items() is kept as a snapshot to serve the next reads. Both are
+    patched with the changes notified by the wrapped repository, so they stay
+    correct even when it's changed directly.
+
+    >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("primo"), Contact("secondo")]
+    >>> cache = CachingContactRepository(mem, size=10)
+    >>> cache.get(1)
+    Contact("secondo", "", "", "", None)
+    >>> cache.get(1)
+    Contact("secondo", "", "", "", None)
+    >>> cache.hits, cache.misses
+    (1, 1)
+    >>> mem.pop(0)
+    Contact("primo", "", "", "", None)
+    >>> cache.get(0)
+    Contact("secondo", "", "", "", None)
+    >>> cache.hits, cache.misses
+    (2, 1)
+    """
+
+    def __init__(self, phonebook: ContactRepository, size: int = 1024):
+        """
+        Wrap a repository with a cache.
+
+        :param phonebook: Repository to cache.
+        :type phonebook: ContactRepository
+        :param size: Maximum number of contacts kept by get.
+        :type size: int
+        """
+        super().__init__()
+        self.phonebook = phonebook
+        self.size = size
+        self.cache: OrderedDict[int, Contact] = OrderedDict()
+        self.snapshot: Optional[List[Contact]] = None
+        self.hits = 0
+        self.misses = 0
+        self.phonebook.subscribe(self.invalidate)
+
+    def invalidate(self, change: ContactChange, id: int, c: Contact) -> None:
+        """
+        Patch the cache and the snapshot with a change of the wrapped repository,
+        then notify it to the listeners of the cache.
+        """
+        if change == ContactChange.UPDATED:
+            if id in self.cache:
+                self.cache[id] = c
+            if self.snapshot is not None:
+                self.snapshot[id] = c
+        else:
+            # Following contacts move by one position.
+            shift = 1 if change == ContactChange.INSERTED else -1
+            self.cache = OrderedDict(
+                (k + shift if k > id or (k == id and shift > 0) else k, v)
+                for k, v in self.cache.items()
+                if k != id or shift > 0
+            )
+            if self.snapshot is not None:
+                if shift > 0:
+                    self.snapshot.insert(id, c)
+                else:
+                    del self.snapshot[id]
+
+        self.notify(change, id, c)
+
+    def append(self, c: Contact) -> int:
+        return self.phonebook.append(c)
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        if self.snapshot is None:
+            if offset or limit is not None:
+                yield from self.phonebook.items(offset, limit)
+                return
+
+            snapshot = [c for c in self.phonebook.items()]
+            logging.info(f"Cached a snapshot of {len(snapshot)} contacts")
+            self.snapshot = snapshot
+
+        stop = None if limit is None else offset + limit
+        yield from islice(self.snapshot, offset, stop)
+
+    def count(self) -> int:
+        if self.snapshot is not None:
+            return len(self.snapshot)
+        return self.phonebook.count()
+
+    def pop(self, id: int) -> Contact:
+        return self.phonebook.pop(id)
+
+    def get(self, id: int) -> Contact:
+        if id in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(id)
+            return self.cache[id]
+
+        if self.snapshot is not None and 0 <= id < len(self.snapshot):
+            self.hits += 1
+            return self.snapshot[id]
+
+        self.misses += 1
+        c = self.phonebook.get(id)
+        if id >= 0:
+            self.cache[id] = c
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return c
+
+    def set(self, id: int, c: Contact):
+        return self.phonebook.set(id, c)
+
+    def query(
+        self,
+        conditions: Iterable[Condition] = (),
+        order_by: Optional[str] = None,
+        reverse: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, Contact]]:
+        return self.phonebook.query(conditions, order_by, reverse, offset, limit)
+
+    @property
+    def newest_first(self) -> bool:
+        return self.phonebook.newest_first
+
+    def frozen(self):
+        return self.phonebook.frozen()
+
+    def close(self) -> None:
+        self.phonebook.close()
+
+    def refresh(self) -> None:
+        self.phonebook.refresh()
+
+    def find_by_telephone(self, number: str) -> List[Tuple[int, Contact]]:
+        return self.phonebook.find_by_telephone(number)
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        return self.phonebook.append_many(contacts)
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        return [self.get(id) for id in ids]
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        return self.phonebook.pop_many(ids)
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        self.phonebook.set_many(changes)
+
+    def clear(self) -> None:
+        """
+        Drop every cached contact.
+        """
+        self.cache.clear()
+        self.snapshot = None
+
+    def hit_ratio(self) -> float:
+        """
+        Return the ratio of reads served by the cache.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
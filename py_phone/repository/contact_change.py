@@ -0,0 +1,20 @@
+from enum import Enum
+from typing import Callable
+
+from py_phone.model.contact import Contact
+
+
+class ContactChange(Enum):
+    """
+    Kind of change notified by a repository to its listeners.
+    """
+
+    INSERTED = "inserted"
+    UPDATED = "updated"
+    REMOVED = "removed"
+
+
+ContactListener = Callable[[ContactChange, int, Contact], None]
+"""
+Function called with the kind of change, the identifier and the contact.
+"""
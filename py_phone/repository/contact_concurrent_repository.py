@@ -0,0 +1,209 @@
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from itertools import accumulate, islice
+import logging
+import threading
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+from py_phone.repository.read_write_lock import ReadWriteLock
+
+
+class ContactConcurrentRepository(ContactRepository):
+    """
+    Save contacts in memory, shared by many threads.
+
+    Unlike ContactMemoryRepository every instance has its own contacts. They
+    are split in shards of at most shard_size contacts, so removing one only
+    moves the contacts of its shard, and the shard of a position is found
+    with a binary search on the position where each shard starts.
+
+    Reads hold a ReadWriteLock to read, so they run together, while changes
+    hold it to write one at a time. Changes are queued while the lock is held
+    and notified after it's released, in the same order they happen, so
+    listeners can take their own locks and read the repository.
+
+    >>> repo = ContactConcurrentRepository(shard_size=2)
+    >>> repo.append_many([Contact("primo"), Contact("secondo"), Contact("terzo")])
+    [0, 1, 2]
+    >>> repo.pop(0)
+    Contact("primo", "", "", "", None)
+    >>> repo.get(1)
+    Contact("terzo", "", "", "", None)
+    >>> [len(shard) for shard in repo.shards]
+    [1, 1]
+    """
+
+    def __init__(self, shard_size: int = 1024):
+        """
+        Open an empty phonebook in memory.
+
+        :param shard_size: Maximum number of contacts in a shard.
+        :type shard_size: int
+        """
+        super().__init__()
+        self.shard_size = shard_size
+        self.lock = ReadWriteLock()
+        self.shards: List[List[Contact]] = [[]]
+        self.starts: List[int] = [0]
+        """
+        Position of the first contact of each shard.
+        """
+
+        self.size = 0
+        self.queued: Deque[Tuple[ContactChange, int, Contact]] = deque()
+        """
+        Changes made and not notified yet, from the oldest.
+        """
+
+        self.notifying = threading.RLock()
+
+    def notify(self, change: ContactChange, id: int, c: Contact) -> None:
+        self.queued.append((change, id, c))
+        self.notify_queued()
+
+    @contextmanager
+    def writing(self):
+        """
+        Hold the lock to write inside the block, then notify the changes made.
+        """
+        try:
+            with self.lock.write():
+                yield
+        finally:
+            self.notify_queued()
+
+    @contextmanager
+    def frozen(self):
+        with self.notifying, self.lock.read():
+            self.notify_queued()
+            yield
+
+    def notify_queued(self) -> None:
+        """
+        Notify the queued changes, unless this thread still holds the lock to
+        write. A single thread notifies at a time, so the order is kept.
+        """
+        if self.lock.writer == threading.get_ident():
+            return
+
+        with self.notifying:
+            while self.queued:
+                super().notify(*self.queued.popleft())
+
+    def locate(self, id: int) -> Tuple[int, int]:
+        """
+        Return the shard of a position and the position inside it.
+
+        Negative positions count from the end, like for a list.
+        """
+        id = range(self.size)[id]
+        shard = bisect_right(self.starts, id) - 1
+        return shard, id - self.starts[shard]
+
+    def reshape(self, shard: int) -> None:
+        """
+        Merge a shard with the next one when they fit together, and compute
+        again where the shards start.
+        """
+        shards = self.shards
+        if shard + 1 < len(shards):
+            if len(shards[shard]) + len(shards[shard + 1]) <= self.shard_size // 2:
+                shards[shard].extend(shards.pop(shard + 1))
+        if not shards[shard] and len(shards) > 1:
+            del shards[shard]
+        self.starts = [0, *accumulate(len(x) for x in shards[:-1])]
+
+    def append(self, c: Contact) -> int:
+        with self.writing():
+            if len(self.shards[-1]) >= self.shard_size:
+                self.shards.append([])
+                self.starts.append(self.size)
+            self.shards[-1].append(c)
+            self.size += 1
+            index = self.size - 1
+            logging.debug("Appended contact %s at %d", c.label(), index)
+            self.notify(ContactChange.INSERTED, index, c)
+            return index
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        with self.lock.read():
+            # Copy the page, so the lock isn't held while it's read.
+            stop = self.size if limit is None else min(offset + limit, self.size)
+            page = []
+            if offset < self.size and offset < stop:
+                shard, i = self.locate(offset)
+                for contacts in islice(self.shards, shard, None):
+                    page.extend(contacts[i : i + stop - offset - len(page)])
+                    i = 0
+                    if len(page) >= stop - offset:
+                        break
+        for contact in page:
+            yield contact
+
+    def count(self) -> int:
+        return self.size
+
+    def pop(self, id: int) -> Contact:
+        with self.writing():
+            shard, i = self.locate(id)
+            id = self.starts[shard] + i
+            c = self.shards[shard].pop(i)
+            self.size -= 1
+            self.reshape(shard)
+            self.notify(ContactChange.REMOVED, id, c)
+            return c
+
+    def get(self, id: int) -> Contact:
+        with self.lock.read():
+            shard, i = self.locate(id)
+            return self.shards[shard][i]
+
+    def set(self, id: int, c: Contact):
+        with self.writing():
+            shard, i = self.locate(id)
+            self.shards[shard][i] = c
+            self.notify(ContactChange.UPDATED, self.starts[shard] + i, c)
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        with self.writing():
+            start = self.size
+            added = []
+            for c in contacts:
+                if len(self.shards[-1]) >= self.shard_size:
+                    self.shards.append([])
+                    self.starts.append(self.size)
+                self.shards[-1].append(c)
+                self.size += 1
+                added.append(c)
+
+            logging.info(f"Appended {self.size - start} contacts at {start}")
+            for i, c in enumerate(added):
+                self.notify(ContactChange.INSERTED, start + i, c)
+            return [i for i in range(start, self.size)]
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        with self.lock.read():
+            return [self.shards[s][i] for s, i in map(self.locate, ids)]
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        with self.writing():
+            positions = range(self.size)
+            ids = [positions[id] for id in ids]
+            if len(set(ids)) != len(ids):
+                raise ValueError("Can't remove the same contact twice.")
+
+            popped = self.get_many(ids)
+            # From the last, so the positions before it don't change.
+            for id in sorted(ids, reverse=True):
+                self.pop(id)
+            return popped
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        with self.writing():
+            for id, c in dict(changes).items():
+                self.set(id, c)
@@ -0,0 +1,354 @@
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.model.telephone import (
+    normalize_telephone,
+    telephone_key,
+    telephones_match,
+)
+from py_phone.repository.contact_query import Condition, check_field
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+
+
+class ContactDbRepository(ContactRepository):
+    """
+    Save contacts in a SQLite database.
+
+    Contacts are rows of the contacts table, in the order of their id. The
+    ids of the rows are cached in memory to find the row of a position
+    without an OFFSET scan, and loaded again only when another connection
+    changed the database.
+
+    The final digits of the normalized telephone number are saved in the
+    indexed telephone_key column, so find_by_telephone is a single lookup.
+    Queries are translated to SQL, using the indexes of the table.
+
+    >>> import os, tempfile
+    >>> repo = ContactDbRepository(os.path.join(tempfile.mkdtemp(), "informazioni.db"))
+    >>> with repo.batch():
+    ...     repo.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    ...     repo.append(Contact("quinto", "sesto", "settimo", "ottavo", 9))
+    0
+    1
+    >>> repo.set(0, Contact("nono", "decimo", "undicesimo", "dodicesimo", 12))
+    >>> repo.pop(1)
+    Contact("quinto", "sesto", "settimo", "ottavo", 9)
+    >>> [x for x in repo.items()]
+    [Contact("nono", "decimo", "undicesimo", "dodicesimo", 12)]
+    >>> repo.find_by_telephone("+39 dodicesimo")
+    []
+    >>> repo.set(0, Contact("nono", "decimo", "", "06 1234567", None))
+    >>> repo.find_by_telephone("0039 061234567")
+    [(0, Contact("nono", "decimo", "", "06 1234567", None))]
+    >>> repo.query([Condition("last_name", "prefix", "dec")])
+    [(0, Contact("nono", "decimo", "", "06 1234567", None))]
+    """
+
+    schema = [
+        """
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            address TEXT NOT NULL,
+            telephone TEXT NOT NULL,
+            age INTEGER,
+            telephone_key TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS contacts_last_name ON contacts (last_name)",
+        "CREATE INDEX IF NOT EXISTS contacts_telephone ON contacts (telephone)",
+    ]
+
+    key_index = (
+        "CREATE INDEX IF NOT EXISTS contacts_telephone_key"
+        " ON contacts (telephone_key)"
+    )
+
+    columns = "first_name, last_name, address, telephone, age"
+
+    def __init__(self, database: str = "informazioni.db"):
+        """
+        Open the database, creating the schema if missing.
+
+        :param database: Path of the SQLite database.
+        :type database: str
+        """
+        super().__init__()
+        self.database = database
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for statement in self.schema:
+                self.connection.execute(statement)
+            self.migrate()
+
+        self.ids: Optional[array] = None
+        """
+        Id of the row of each position, None when it must be loaded.
+        """
+
+        self.version: Optional[int] = None
+        self.depth = 0
+        self.queued: List[Tuple[ContactChange, int, Contact]] = []
+        """
+        Changes made inside a batch, notified when it's committed.
+        """
+
+    def migrate(self) -> None:
+        """
+        Add the telephone_key column to databases created without it, and fill
+        it for the rows written before it existed.
+        """
+        cursor = self.connection.execute("PRAGMA table_info(contacts)")
+        if "telephone_key" not in [row[1] for row in cursor]:
+            self.connection.execute(
+                "ALTER TABLE contacts ADD COLUMN telephone_key TEXT"
+            )
+        self.connection.execute(self.key_index)
+
+        missing = self.connection.execute(
+            "SELECT id, telephone FROM contacts WHERE telephone_key IS NULL"
+        ).fetchall()
+        self.connection.executemany(
+            "UPDATE contacts SET telephone_key = ? WHERE id = ?",
+            [(telephone_key(normalize_telephone(t)), id) for id, t in missing],
+        )
+        if missing:
+            logging.info(f"Indexed {len(missing)} telephone numbers")
+
+    @contextmanager
+    def batch(self):
+        """
+        Run every operation inside the block in a single transaction, committed
+        at the end of the block or rolled back if it raises.
+
+        Listeners are notified of the changes only after the commit, so they
+        never see changes rolled back.
+
+        >>> import os, tempfile
+        >>> repo = ContactDbRepository(os.path.join(tempfile.mkdtemp(), "informazioni.db"))
+        >>> changes = []
+        >>> repo.subscribe(lambda change, id, c: changes.append(change.value))
+        >>> try:
+        ...     with repo.batch():
+        ...         repo.append(Contact("primo"))
+        ...         raise ValueError()
+        ... except ValueError:
+        ...     pass
+        0
+        >>> changes, repo.count()
+        ([], 0)
+        """
+        self.depth += 1
+        try:
+            yield self
+            if self.depth == 1:
+                self.connection.commit()
+        except BaseException:
+            if self.depth == 1:
+                self.connection.rollback()
+                self.ids = None
+                self.queued.clear()
+            raise
+        finally:
+            self.depth -= 1
+
+        if not self.depth:
+            queued, self.queued = self.queued, []
+            for change, id, c in queued:
+                super().notify(change, id, c)
+
+    def notify(self, change: ContactChange, id: int, c: Contact) -> None:
+        if self.depth:
+            self.queued.append((change, id, c))
+        else:
+            super().notify(change, id, c)
+
+    def rows(self) -> array:
+        """
+        Return the ids of the rows in order, loading them if the database was
+        changed by another connection.
+        """
+        version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if self.ids is None or version != self.version:
+            ids = array("q")
+            cursor = self.connection.execute("SELECT id FROM contacts ORDER BY id")
+            for (id,) in cursor:
+                ids.append(id)
+            logging.info(f"Loaded {len(ids)} contacts from {self.database}")
+            self.ids = ids
+            self.version = version
+
+        return self.ids
+
+    def values(self, c: Contact):
+        age = c.age if c.age not in ("", None) else None
+        key = telephone_key(normalize_telephone(c.telephone))
+        return (c.first_name, c.last_name, c.address, c.telephone, age, key)
+
+    def append(self, c: Contact) -> int:
+        with self.batch():
+            ids = self.rows()
+            cursor = self.connection.execute(
+                f"INSERT INTO contacts ({self.columns}, telephone_key)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                self.values(c),
+            )
+            ids.append(cursor.lastrowid)
+
+        index = len(ids) - 1
+        logging.debug("Appended contact %s at %d", c.label(), index)
+        self.notify(ContactChange.INSERTED, index, self.get(index))
+        return index
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        rows = self.rows()
+        if offset >= len(rows):
+            return
+
+        # Start from the id of the offset, instead of skipping rows with OFFSET.
+        cursor = self.connection.execute(
+            f"SELECT {self.columns} FROM contacts WHERE id >= ? ORDER BY id LIMIT ?",
+            (rows[offset], -1 if limit is None else limit),
+        )
+        for row in cursor:
+            yield Contact(*row)
+
+    def count(self) -> int:
+        return len(self.rows())
+
+    def pop(self, id: int) -> Contact:
+        with self.batch():
+            ids = self.rows()
+            id = range(len(ids))[id]
+            c = self.get(id)
+            self.connection.execute("DELETE FROM contacts WHERE id = ?", (ids[id],))
+            del ids[id]
+        self.notify(ContactChange.REMOVED, id, c)
+        return c
+
+    def get(self, id: int) -> Contact:
+        row = self.connection.execute(
+            f"SELECT {self.columns} FROM contacts WHERE id = ?", (self.rows()[id],)
+        ).fetchone()
+        return Contact(*row)
+
+    def set(self, id: int, c: Contact):
+        with self.batch():
+            id = range(len(self.rows()))[id]
+            self.connection.execute(
+                "UPDATE contacts SET first_name = ?, last_name = ?, address = ?,"
+                " telephone = ?, age = ?, telephone_key = ? WHERE id = ?",
+                (*self.values(c), self.rows()[id]),
+            )
+        self.notify(ContactChange.UPDATED, id, self.get(id))
+
+    def find_by_telephone(self, number: str) -> List[Tuple[int, Contact]]:
+        number = normalize_telephone(number)
+        if not number:
+            return []
+
+        rows = self.rows()
+        cursor = self.connection.execute(
+            f"SELECT id, {self.columns} FROM contacts WHERE telephone_key = ?"
+            " ORDER BY id",
+            (telephone_key(number),),
+        )
+        return [
+            (bisect_left(rows, id), Contact(*row))
+            for id, *row in cursor
+            if telephones_match(normalize_telephone(row[3]), number)
+        ]
+
+    def clause(self, condition: Condition) -> Tuple[str, tuple]:
+        """
+        Translate a condition to SQL, with its parameters.
+        """
+        field, operator, value = condition.field, condition.operator, condition.value
+        if operator == "between":
+            return f"{field} BETWEEN ? AND ?", value
+        if operator == "contains":
+            return f"instr({field}, ?) > 0", (value,)
+        if operator == "prefix":
+            if not value:
+                return "1", ()
+            # A range instead of LIKE, to use the index and keep upper case.
+            end = value[:-1] + chr(ord(value[-1]) + 1)
+            return f"{field} >= ? AND {field} < ?", (value, end)
+        return f"{field} {operator} ?", (value,)
+
+    def query(
+        self,
+        conditions: Iterable[Condition] = (),
+        order_by: Optional[str] = None,
+        reverse: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, Contact]]:
+        conditions = list(conditions)
+        clauses, parameters = ["1"], []
+        for condition in conditions:
+            clause, values = self.clause(condition)
+            clauses.append(clause)
+            parameters.extend(values)
+
+        ordering = "id"
+        if order_by is not None:
+            ordering = f"{check_field(order_by)}{' DESC' if reverse else ''}, id"
+
+        rows = self.rows()
+        cursor = self.connection.execute(
+            f"SELECT id, {self.columns} FROM contacts WHERE {' AND '.join(clauses)}"
+            f" ORDER BY {ordering} LIMIT ? OFFSET ?",
+            (*parameters, -1 if limit is None else limit, offset),
+        )
+        # Check again in Python, since SQLite compares ages saved as text too.
+        found = [(bisect_left(rows, id), Contact(*row)) for id, *row in cursor]
+        return [x for x in found if all(c.matches(x[1]) for c in conditions)]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        with self.batch():
+            return super().append_many(contacts)
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        with self.batch():
+            rows = self.rows()
+            positions = range(len(rows))
+            ids = [positions[id] for id in ids]
+            removed = set(ids)
+            if len(removed) != len(ids):
+                raise ValueError("Can't remove the same contact twice.")
+
+            contacts = self.get_many(ids)
+            self.connection.executemany(
+                "DELETE FROM contacts WHERE id = ?", [(rows[id],) for id in ids]
+            )
+            self.ids = array("q", (r for i, r in enumerate(rows) if i not in removed))
+        for id, c in sorted(zip(ids, contacts), key=lambda x: x[0], reverse=True):
+            self.notify(ContactChange.REMOVED, id, c)
+        return contacts
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        with self.batch():
+            rows = self.rows()
+            positions = range(len(rows))
+            changes = {positions[id]: c for id, c in dict(changes).items()}
+            self.connection.executemany(
+                "UPDATE contacts SET first_name = ?, last_name = ?, address = ?,"
+                " telephone = ?, age = ?, telephone_key = ? WHERE id = ?",
+                [(*self.values(c), rows[id]) for id, c in changes.items()],
+            )
+        for id, contact in zip(changes, self.get_many(changes)):
+            self.notify(ContactChange.UPDATED, id, contact)
@@ -1,7 +1,14 @@
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import io
+from itertools import islice
+import multiprocessing
 import re
-from typing import List
+from typing import BinaryIO, Dict, Generator, Iterable, List, Optional, Tuple
 from py_phone.model.contact import Contact
-from py_phone.repository.contact_repository import ContactRepository
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+from py_phone.repository.write_buffer import WriteBuffer, fsync_policies
 
 
 import logging
@@ -15,6 +22,20 @@ class ContactFileFormatter:
 
     separator = "~"
 
+    ignored = str.maketrans(
+        "",
+        "",
+        "".join(chr(i) for i in range(0x3001) if chr(i).isspace() and i != 10),
+    )
+    """
+    Whitespaces removed from the records, besides newlines.
+    """
+
+    chunk_size = 1 << 20
+    """
+    Bytes read at a time by decode.
+    """
+
     def format(self, contact: Contact):
         return f"{contact.first_name}{self.separator}{contact.last_name}{self.separator}{contact.address}{self.separator}{contact.telephone}{self.separator}{contact.age}"
 
@@ -25,7 +46,7 @@ class ContactFileFormatter:
         >>> ContactFileFormatter().get(Contact("primo", "secondo", "terzo", "quarto", 5))
         'primo~secondo~terzo~quarto~5'
         """
-        return self.separator.join([str(v) for v in list(vars(contact).values())])
+        return self.separator.join([str(v) for v in contact.fields()])
 
     def set(self, string: str):
         """
@@ -52,83 +73,558 @@ class ContactFileFormatter:
             "".join(splitted[4].split()),
         )
 
+    def decode(
+        self, chunks: Iterable[bytes], limit: Optional[int] = None
+    ) -> Generator[Contact, None, None]:
+        """
+        Convert the records in a stream of bytes to contacts, like set does
+        for each line, keeping in memory only a chunk at a time.
+
+        Each chunk is decoded and cleaned with a single call, instead of a
+        regular expression for each field. Broken records are logged and
+        skipped, but they count for the limit like the others.
+
+        >>> data = [b"primo~secondo~ter", b"zo~quarto~5\\n\\n quinto~+39~x~y~ 1 2 \\nbroken\\n"]
+        >>> [x for x in ContactFileFormatter().decode(data)]
+        [Contact("primo", "secondo", "terzo", "quarto", 5), Contact("quinto", "39", "x", "y", 12)]
+
+        :param chunks: Content of the file, split anywhere.
+        :type chunks: Iterable[bytes]
+        :param limit: Maximum number of records to read, None for all of them.
+        :type limit: Optional[int]
+        """
+
+        def texts():
+            rest = b""
+            for chunk in chunks:
+                end = chunk.rfind(b"\n")
+                if end < 0:
+                    rest += chunk
+                    continue
+
+                yield (rest + chunk[: end + 1]).decode("utf-8")
+                rest = chunk[end + 1 :]
+            yield rest.decode("utf-8")
+
+        for text in texts():
+            for record in self.records(text):
+                if limit is not None:
+                    if limit <= 0:
+                        return
+                    limit -= 1
+                if contact := self.split(record):
+                    yield contact
+
+    def records(self, text: str) -> List[str]:
+        """
+        Return the non blank records in text, without whitespaces.
+        """
+        return [x for x in text.translate(self.ignored).split("\n") if x]
+
+    def split(self, record: str) -> Optional[Contact]:
+        """
+        Convert a record cleaned by records to a contact, None if it's broken.
+        """
+        if fields := self.fields(record):
+            return Contact(*fields)
+        return None
+
+    def fields(self, record: str) -> Optional[Tuple[str, str, str, str, str]]:
+        """
+        Return the five fields of a record cleaned by records, None if it's
+        broken.
+        """
+        fields = record.replace("+", "").split(self.separator)
+        if len(fields) < 5:
+            logging.error("Can't yield contact due to less then 5 fields")
+            return None
+        return (fields[0], fields[1], fields[2], fields[3], fields[4])
+
 
 class ContactFileRepository(ContactRepository):
     """
     Save contacts in a file.
 
-    This doen't work well with big files in order of gigabytes.
+    The repository keeps the byte offset where each record starts, so a contact
+    is read with a single seek. The offsets are rebuilt only when the file is
+    changed by someone else.
+
+    With more than one process, a full read of a big file is split in chunks
+    of whole lines, parsed in parallel by a pool of processes and yielded in
+    the order of the file.
+
+    Appended contacts can wait in a WriteBuffer and be written together with
+    a single write. Every other operation writes them first.
+
+    A hash of each record is kept with its offset. When someone else changes
+    the file, the hashes are compared with the new ones and only the records
+    that differ are read and notified to the listeners.
+
+    >>> import tempfile
+    >>> repo = ContactFileRepository(os.path.join(tempfile.mkdtemp(), "informazioni.txt"))
+    >>> repo.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    0
+    >>> repo.append(Contact("quinto", "sesto", "settimo", "ottavo", 9))
+    1
+    >>> repo.get(1)
+    Contact("quinto", "sesto", "settimo", "ottavo", 9)
+    >>> repo.pop(0)
+    Contact("primo", "secondo", "terzo", "quarto", 5)
+    >>> repo.get(0)
+    Contact("quinto", "sesto", "settimo", "ottavo", 9)
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        file: str = "informazioni.txt",
+        processes: int = 1,
+        parallel_chunk: int = 1 << 24,
+        buffer_size: int = 1,
+        buffer_delay: float = 0.0,
+        fsync: str = "none",
+    ):
+        """
+        Open the phonebook file, creating it if missing.
+
+        :param file: Path of the file.
+        :type file: str
+        :param processes: Processes parsing the file in items, 1 to parse it here.
+        :type processes: int
+        :param parallel_chunk: Bytes parsed by a process at a time.
+        :type parallel_chunk: int
+        :param buffer_size: Appended contacts written together, 1 to write each
+            one at once.
+        :type buffer_size: int
+        :param buffer_delay: Seconds an appended contact can wait to be
+            written, 0 to wait for buffer_size contacts. Otherwise a timer
+            thread writes them, so use the repository from one thread only.
+        :type buffer_delay: float
+        :param fsync: One of fsync_policies. With write, every append is
+            written and forced to the disk before returning.
+        :type fsync: str
+        """
         super().__init__()
-        self.file = "informazioni.txt"
+        if fsync not in fsync_policies:
+            raise ValueError(f"Unknown fsync policy {fsync}.")
+        self.file = file
+        self.processes = processes
+        self.parallel_chunk = parallel_chunk
+        self.fsync = fsync
+        self.buffer = WriteBuffer(
+            self.write_records, 1 if fsync == "write" else buffer_size, buffer_delay
+        )
         # Look for file
         if not os.path.isfile(self.file):
             with open(self.file, "w", encoding="utf-8") as w:
                 w.write("")
 
-    def append(self, c: Contact):
-        with open(self.file, "a+", encoding="utf-8") as a:
-            line = ContactFileFormatter().format(c)
-            a.writelines([line, "\n"])
-
-        with open(self.file, "r", encoding="utf-8") as r:
-            # Return the number of rows in a as identifier.
-            index = sum(1 for _ in r) - 1
-            logging.info(f"Appended contact {c.label()} at {index}")
-            return index
-
-    def items(self):
-        logging.info("Reading items from file")
+        self.offsets: List[int] = []
+        """
+        Byte offset of the start of each record in the file.
+        """
+
+        self.digests = array("q")
+        """
+        Hash of each record, without the trailing whitespaces.
+        """
+
+        self.signature: Optional[Tuple[int, int]] = None
+        """
+        Modification time and size of the file when offsets were built.
+        """
+
+    def stat_signature(self) -> Tuple[int, int]:
+        """
+        Return modification time and size of the file, used to detect changes.
+        """
+        stat = os.stat(self.file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def index(self) -> List[int]:
+        """
+        Return the offsets of the records, scanning the file again only if it
+        changed since the last time.
+        """
+        signature = self.stat_signature()
+        if signature != self.signature:
+            offsets = []
+            digests = array("q")
+            position = 0
+            with open(self.file, "rb") as r:
+                for line in r:
+                    if line.strip():
+                        offsets.append(position)
+                        digests.append(hash(line.rstrip()))
+                    position += len(line)
+
+            self.bytes_read += position
+            logging.info(f"Indexed {len(offsets)} records of {self.file}")
+            known = self.signature is not None
+            self.offsets, self.signature = offsets, signature
+            self.digests, digests = digests, self.digests
+            if known:
+                self.reload(digests)
+
+        return self.offsets
+
+    def reload(self, known: array) -> None:
+        """
+        Notify the records changed by someone else, reading only the ones
+        whose hash isn't among the known ones.
+
+        Equal records are skipped a block at a time. Where the hashes differ,
+        a record missing from the other side was removed or inserted, and
+        otherwise it's notified as updated.
+
+        :param known: Hash of each record before the file changed.
+        :type known: array
+        """
+        digests = self.digests
+        block = 1024
+        i = j = 0
+        end_i, end_j = len(known), len(digests)
+        while min(end_i, end_j) >= block and (
+            known[end_i - block : end_i] == digests[end_j - block : end_j]
+        ):
+            end_i, end_j = end_i - block, end_j - block
+        while end_i and end_j and known[end_i - 1] == digests[end_j - 1]:
+            end_i, end_j = end_i - 1, end_j - 1
+
+        old, new = None, None
+        changes: List[Tuple[ContactChange, int]] = []
+        # Records before j are the new ones and from i on the known ones, so
+        # j is the position of every change when it's notified.
+        while i < end_i or j < end_j:
+            if i < end_i and j < end_j and known[i] == digests[j]:
+                if known[i : i + block] == digests[j : j + block]:
+                    i, j = min(i + block, end_i), min(j + block, end_j)
+                else:
+                    i, j = i + 1, j + 1
+                continue
+
+            if old is None:
+                old, new = set(known[i:end_i]), set(digests[j:end_j])
+            removed = j == end_j or (i < end_i and known[i] not in new)
+            inserted = i == end_i or (j < end_j and digests[j] not in old)
+            if removed and not inserted:
+                changes.append((ContactChange.REMOVED, j))
+                i += 1
+            elif inserted and not removed:
+                changes.append((ContactChange.INSERTED, j))
+                j += 1
+            else:
+                changes.append((ContactChange.UPDATED, j))
+                i, j = i + 1, j + 1
+
         formatter = ContactFileFormatter()
-        with open(self.file, "r", encoding="utf-8") as r:
-            for line in r.readlines():
-                split = "".join(line.split())
-                if len(split):
-                    logging.info(f"Reading item line {split}:{len(split)}.")
+        contacts: Dict[int, Contact] = {}
+        with open(self.file, "rb") as r:
+            for change, id in changes:
+                if change != ContactChange.REMOVED:
+                    r.seek(self.offsets[id])
+                    line = r.readline()
+                    self.bytes_read += len(line)
                     try:
-                        contact = formatter.set(split)
-                        yield contact
-                    except ValueError as v:
-                        logging.error(f"Can't yield contact due to {v}")
+                        contacts[id] = formatter.set(line.decode("utf-8"))
+                    except ValueError as e:
+                        logging.error(f"Can't read record {id} due to {e}")
 
-    def pop(self, id):
-        with open(self.file, "r", encoding="utf-8") as p:
-            lines = p.readlines()
+        logging.info(f"Reloaded {len(changes)} records changed in {self.file}")
+        for change, id in changes:
+            self.notify(change, id, contacts.get(id, Contact()))
 
-        if len(lines) < id:
-            raise IndexError("Index out of bound error.")
+    def refresh(self) -> None:
+        self.flush()
+        self.index()
 
+    def read_record(self, id: int) -> str:
+        """
+        Read the line of the record with given id.
+        """
+        offsets = self.index()
+        with open(self.file, "rb") as r:
+            r.seek(offsets[id])
+            line = r.readline()
+            self.bytes_read += len(line)
+            return line.decode("utf-8")
+
+    def append(self, c: Contact):
+        with self.buffer.lock:
+            # Return the number of records as identifier.
+            written = self.offsets if self.buffer.pending else self.index()
+            index = len(written) + len(self.buffer.pending)
+            self.buffer.add(c)
+
+        logging.debug("Appended contact %s at %d", c.label(), index)
+        self.notify(ContactChange.INSERTED, index, self.stored(c))
+        return index
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        logging.debug("Reading items from %s", self.file)
+        self.flush()
+        start = 0
+        if offset:
+            offsets = self.index()
+            if offset >= len(offsets):
+                return
+            start = offsets[offset]
+
+        end = os.path.getsize(self.file)
+        if self.processes > 1 and limit is None and end - start > self.parallel_chunk:
+            yield from self.parallel_items(start, end)
+            return
+
+        with open(self.file, "rb") as r:
+            r.seek(start)
+            yield from ContactFileFormatter().decode(self.chunks(r), limit)
+
+    def parallel_items(self, start: int, end: int):
+        """
+        Parse the file between the given offsets in a pool of processes,
+        yielding the contacts in order.
+        """
+        ranges = iter(self.chunk_ranges(start, end))
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(self.processes, mp_context=context)
         try:
-            c = ContactFileFormatter().set(lines[id])
-            del lines[id]
+            # Keep a few chunks per process running, not the whole file.
+            pending = deque(
+                (executor.submit(self.parse_range, self.file, a, b), b - a)
+                for a, b in islice(ranges, 2 * self.processes)
+            )
+            while pending:
+                future, length = pending.popleft()
+                rows = future.result()
+                for a, b in islice(ranges, 1):
+                    future = executor.submit(self.parse_range, self.file, a, b)
+                    pending.append((future, b - a))
+                self.bytes_read += length
+                for fields in rows:
+                    yield Contact(*fields)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def chunk_ranges(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        Split the file between the given offsets in ranges of whole lines, of
+        about parallel_chunk bytes.
+        """
+        bounds = [start]
+        with open(self.file, "rb") as r:
+            for cut in range(start + self.parallel_chunk, end, self.parallel_chunk):
+                if cut > bounds[-1]:
+                    # Move the cut after the end of the line it falls in.
+                    r.seek(cut - 1)
+                    r.readline()
+                    bounds.append(min(r.tell(), end))
+        bounds.append(end)
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+    @staticmethod
+    def parse_range(file: str, start: int, end: int) -> List[Tuple[str, ...]]:
+        """
+        Return the fields of the records in the file between the given offsets.
+
+        It runs in the processes of the pool, so it returns plain tuples that
+        are cheaper to send back than contacts.
+        """
+        with open(file, "rb") as r:
+            r.seek(start)
+            text = r.read(end - start).decode("utf-8")
+
+        formatter = ContactFileFormatter()
+        return [f for x in formatter.records(text) if (f := formatter.fields(x))]
+
+    def chunks(self, r: BinaryIO):
+        """
+        Read the rest of an open file a chunk at a time.
+        """
+        while chunk := r.read(ContactFileFormatter.chunk_size):
+            self.bytes_read += len(chunk)
+            yield chunk
 
-            self.write_all(lines)
+    def count(self) -> int:
+        self.flush()
+        return len(self.index())
+
+    def pop(self, id):
+        self.flush()
+        if not -len(self.index()) <= id < len(self.offsets):
+            raise IndexError("Index out of bound error.")
+
+        try:
+            id = range(len(self.offsets))[id]
+            c = ContactFileFormatter().set(self.read_record(id))
+            self.splice({id: b""})
+            self.notify(ContactChange.REMOVED, id, c)
             return c
         except Exception as e:
             logging.error(f"Error when popping contact {id} due to {e}")
             return None
 
     def get(self, id: int) -> Contact:
-        logging.info(f"Want to read contact {id}")
-        with open(self.file, "r+", encoding="utf-8") as r:
-            lines = r.readlines()
-
-        return ContactFileFormatter().set(lines[id])
+        logging.debug("Want to read contact %d", id)
+        self.flush()
+        return ContactFileFormatter().set(self.read_record(id))
 
     def set(self, id, c):
-        with open(self.file, "r", encoding="utf-8") as r:
-            lines = r.readlines()
-
-        if len(lines) < id:
+        self.flush()
+        if not -len(self.index()) <= id < len(self.offsets):
             raise IndexError("Index out of bound.")
 
+        id = range(len(self.offsets))[id]
         string = ContactFileFormatter().get(c)
-        lines[id] = string + "\n"
-        logging.info(f"Update row {id} using {string}")
+        logging.debug("Update row %d using %s", id, string)
+
+        self.splice({id: (string + "\n").encode("utf-8")})
+        self.notify(ContactChange.UPDATED, id, self.stored(c))
+
+    def stored(self, c: Contact) -> Contact:
+        """
+        Return the contact as it will be read back from the file.
+        """
+        formatter = ContactFileFormatter()
+        return formatter.set(formatter.format(c))
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        added = list(contacts)
+        self.flush()
+        start = self.write_records(added)
+        logging.info(f"Appended {len(added)} contacts at {start}")
+        for i, c in enumerate(added):
+            self.notify(ContactChange.INSERTED, start + i, self.stored(c))
+        return [i for i in range(start, start + len(added))]
+
+    def write_records(self, contacts: List[Contact]) -> int:
+        """
+        Write contacts at the end of the file with a single write, without
+        notifying them.
+
+        :return: Identifier of the first contact written.
+        :rtype: int
+        """
+        offsets = self.index()
+        formatter = ContactFileFormatter()
+        start = len(offsets)
+        with open(self.file, "r+b") as a:
+            offset = a.seek(0, os.SEEK_END)
+            out = io.BytesIO()
+            if offset > 0:
+                # Don't glue the new record to a last line without newline.
+                a.seek(offset - 1)
+                if a.read(1) != b"\n":
+                    out.write(b"\n")
+            added = []
+            digests = []
+            for c in contacts:
+                added.append(offset + out.tell())
+                record = formatter.format(c).encode("utf-8")
+                digests.append(hash(record.rstrip()))
+                out.write(record + b"\n")
+            a.write(out.getbuffer())
+            self.bytes_written += out.tell()
+            if self.fsync != "none":
+                a.flush()
+                os.fsync(a.fileno())
+
+        offsets.extend(added)
+        self.digests.extend(digests)
+        self.signature = self.stat_signature()
+        return start
+
+    def flush(self) -> None:
+        """
+        Write the appended contacts still waiting in the buffer.
+        """
+        self.buffer.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        self.flush()
+        offsets = self.index()
+        formatter = ContactFileFormatter()
+        contacts = []
+        with open(self.file, "rb") as r:
+            for id in ids:
+                r.seek(offsets[id])
+                line = r.readline()
+                self.bytes_read += len(line)
+                contacts.append(formatter.set(line.decode("utf-8")))
+        return contacts
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        self.flush()
+        positions = range(len(self.index()))
+        ids = [positions[id] for id in ids]
+        contacts = self.get_many(ids)
+        changes = {id: b"" for id in ids}
+        if len(changes) != len(ids):
+            raise ValueError("Can't remove the same contact twice.")
+
+        self.splice(changes)
+        for id, c in sorted(zip(ids, contacts), key=lambda x: x[0], reverse=True):
+            self.notify(ContactChange.REMOVED, id, c)
+        return contacts
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        formatter = ContactFileFormatter()
+        self.flush()
+        positions = range(len(self.index()))
+        changes = {positions[id]: c for id, c in dict(changes).items()}
+        self.splice(
+            {id: (formatter.get(c) + "\n").encode("utf-8") for id, c in changes.items()}
+        )
+        for id, c in changes.items():
+            self.notify(ContactChange.UPDATED, id, self.stored(c))
+
+    def splice(self, changes: Dict[int, bytes]) -> None:
+        """
+        Replace the records with given ids, or remove them when empty.
+
+        Only the part of the file after the first changed record is rewritten,
+        in a single write, and the offsets are rebuilt while writing it.
+
+        :param changes: New content of the line of each id, newline included.
+        :type changes: Dict[int, bytes]
+        """
+        offsets = self.index()
+        positions = range(len(offsets))
+        changes = {positions[id]: record for id, record in changes.items()}
+        if not changes:
+            return
+
+        first = min(changes)
+        start = offsets[first]
+        with open(self.file, "r+b") as f:
+            f.seek(start)
+            tail = io.BytesIO(f.read())
+            out = io.BytesIO()
+            del offsets[first:]
+            del self.digests[first:]
+            id = first
+            for line in tail:
+                if line.strip():
+                    line = changes.get(id, line)
+                    id += 1
+                    if line:
+                        offsets.append(start + out.tell())
+                        self.digests.append(hash(line.rstrip()))
+                out.write(line)
+
+            f.seek(start)
+            f.write(out.getbuffer())
+            f.truncate()
+            if self.fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+            self.bytes_read += len(tail.getbuffer())
+            self.bytes_written += out.tell()
 
-        self.write_all(lines)
+        self.signature = self.stat_signature()
 
     def write_all(self, lines: List[str]) -> None:
         no_empty = [x for x in lines if len(x.split())]
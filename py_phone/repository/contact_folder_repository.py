@@ -1,12 +1,17 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+from itertools import islice
 import logging
 import os
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import uuid
 
 from py_phone.model.contact import Contact
-from py_phone.repository.contact_repository import ContactRepository
+from py_phone.repository.change_watcher import ChangeWatcher
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+from py_phone.repository.write_buffer import WriteBuffer, fsync_paths, fsync_policies
 
 
 class ContactFolderFormatter:
@@ -22,7 +27,7 @@ class ContactFolderFormatter:
         >>> ContactFolderFormatter().get(Contact("primo", "secondo", "terzo", "quarto", 5))
         'primo\\nsecondo\\nterzo\\nquarto\\n5'
         """
-        return self.separator.join([str(v) for v in list(vars(contact).values())])
+        return self.separator.join([str(v) for v in contact.fields()])
 
     def set(self, string: List[str]):
         """
@@ -36,7 +41,7 @@ class ContactFolderFormatter:
         Contact("primo", "secondo", "terzo", "quarto", 5)
 
         """
-        logging.info(f"Extracting {string}")
+        logging.debug("Extracting %s", string)
         if len(string) < 5:
             raise ValueError("Given contact has less then 5 fields.")
 
@@ -52,104 +57,693 @@ class ContactFolderFormatter:
 class ContactFolderRepository(ContactRepository):
     """
     Save contacts in a file for each contact inside a phonebook folder.
+
+    The order of the files is kept in a manifest inside the folder, so the
+    folder is listed and sorted again only when someone else changes it. The
+    manifest starts with the modification time of the folder when it was last
+    written, followed by the file names from the oldest to the newest.
+
+    Appended contacts can wait in a WriteBuffer, so a burst of them updates
+    the manifest once. Every other operation writes them first.
+
+    Files changed by someone else are read again and notified to the
+    listeners one by one. After the first refresh they are told by a
+    ChangeWatcher, otherwise they are found when the folder time changes,
+    comparing the names and the change time of the files, so files edited in
+    place are seen only when the folder changes too.
+
+    >>> import tempfile, time
+    >>> repo = ContactFolderRepository(os.path.join(tempfile.mkdtemp(), "informazioni"))
+    >>> repo.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    0
+    >>> repo.append(Contact("quinto", "sesto", "settimo", "ottavo", 9))
+    0
+    >>> repo.get(1)
+    Contact("primo", "secondo", "terzo", "quarto", 5)
+    >>> repo.pop(0)
+    Contact("quinto", "sesto", "settimo", "ottavo", 9)
+    >>> len(ContactFolderRepository(repo.folder).sorted_files())
+    1
+    >>> changes = []
+    >>> repo.subscribe(lambda change, id, c: changes.append((change.value, id)))
+    >>> other = ContactFolderRepository(repo.folder)
+    >>> time.sleep(0.01)  # let the folder time change
+    >>> other.set(0, Contact("primo", "secondo", "terzo", "quarto", 6))
+    >>> other.append(Contact("nono", "decimo", "undicesimo", "dodicesimo", 13))
+    0
+    >>> repo.count(), changes
+    (2, [('updated', 0), ('inserted', 0)])
+    >>> repo.get(1)
+    Contact("primo", "secondo", "terzo", "quarto", 6)
+    """
+
+    newest_first = True
+
+    sharded = False
+    """
+    Put new files in subfolders named after the first characters of the uuid.
     """
 
-    def __init__(self):
+    manifest_name = ".manifest"
+    """
+    Name of the manifest file inside the folder.
+    """
+
+    header_width = 20
+    """
+    Width of the header line, fixed to rewrite it in place.
+    """
+
+    def __init__(
+        self,
+        folder: str = "informazioni",
+        workers: int = 8,
+        prefetch: int = 32,
+        buffer_size: int = 1,
+        buffer_delay: float = 0.0,
+        fsync: str = "none",
+    ):
+        """
+        Open the phonebook folder, creating it if missing.
+
+        :param folder: Path of the folder.
+        :type folder: str
+        :param workers: Threads reading files in items, 1 to read them in turn.
+        :type workers: int
+        :param prefetch: Files read ahead of the one being yielded by items.
+        :type prefetch: int
+        :param buffer_size: Appended contacts written together, 1 to write each
+            one at once.
+        :type buffer_size: int
+        :param buffer_delay: Seconds an appended contact can wait to be
+            written, 0 to wait for buffer_size contacts. Otherwise a timer
+            thread writes them, so use the repository from one thread only.
+        :type buffer_delay: float
+        :param fsync: One of fsync_policies. With write, every append is
+            written and forced to the disk before returning.
+        :type fsync: str
+        """
         super().__init__()
-        self.folder = "informazioni"
+        if fsync not in fsync_policies:
+            raise ValueError(f"Unknown fsync policy {fsync}.")
+        self.folder = folder
+        self.workers = workers
+        self.prefetch = max(prefetch, workers)
+        self.fsync = fsync
+        self.buffer = WriteBuffer(
+            self.write_contacts, 1 if fsync == "write" else buffer_size, buffer_delay
+        )
         if not os.path.isdir(self.folder):
             os.mkdir(self.folder)
 
+        self.names: List[str] = []
+        """
+        File names from the oldest to the newest contact.
+        """
+
+        self.mtime: Optional[int] = None
+        """
+        Modification time of the folder when the manifest was last synced.
+        """
+
+        self.watcher: Optional[ChangeWatcher] = None
+        """
+        Watcher of the files in the folder, started by the first refresh.
+        """
+
+        self.changed: Set[str] = set()
+        """
+        Files changed by someone else, told by the watcher and not read yet.
+        """
+
+        self.lost = False
+        """
+        Tell if the watcher lost some changes, so the folder is listed again.
+        """
+
     def list_files(self):
         """
-        List all files in the folder. Does not sort them.
-        """
-        for f in os.listdir(self.folder):
-            if os.path.isfile(os.path.join(self.folder, f)):
-                yield f
-    
-    def sorted_files(self):
-        names = [f for f in self.list_files()]
-        logging.info(f"In the folder there are {len(names)} files = {names}.")
-        names.sort(
-            key=lambda f: os.path.getctime(os.path.join(self.folder, f)), reverse=True
+        List all files in the folder, shards included. Does not sort them.
+        """
+        for name, _ in self.scan_files():
+            yield name
+
+    def scan_files(self, folder: str = ""):
+        """
+        Walk the folder and its shards one directory at a time, yielding the
+        name of each file relative to the folder and its change time in
+        nanoseconds.
+        """
+        with os.scandir(os.path.join(self.folder, folder)) as entries:
+            for entry in entries:
+                name = f"{folder}/{entry.name}" if folder else entry.name
+                if entry.is_dir():
+                    yield from self.scan_files(name)
+                elif entry.is_file() and name != self.manifest_name:
+                    yield name, entry.stat().st_ctime_ns
+
+    def folder_mtime(self) -> int:
+        return os.stat(self.folder).st_mtime_ns
+
+    def manifest_path(self) -> str:
+        return os.path.join(self.folder, self.manifest_name)
+
+    def write_manifest(self) -> None:
+        """
+        Write the whole manifest, stamped with the current folder time.
+
+        The manifest is rewritten in place, so the folder time doesn't change.
+        """
+        path = self.manifest_path()
+        if not os.path.isfile(path):
+            open(path, "w", encoding="utf-8").close()
+
+        self.mtime = self.folder_mtime()
+        with open(path, "w", encoding="utf-8") as w:
+            w.write(f"{self.mtime:0{self.header_width}d}\n")
+            w.writelines(f"{name}\n" for name in self.names)
+
+    def manifest(self) -> List[str]:
+        """
+        Return the file names from the oldest to the newest, listing the folder
+        only if the manifest is missing or older than the folder.
+
+        The changes made by someone else since the last call are notified
+        first.
+        """
+        if self.watcher is not None and self.watcher.available:
+            self.collect()
+            if self.lost:
+                self.lost = False
+                self.rescan()
+            elif self.changed:
+                self.read_changed()
+
+        mtime = self.folder_mtime()
+        if mtime == self.mtime:
+            return self.names
+
+        try:
+            with open(self.manifest_path(), "r", encoding="utf-8") as r:
+                header = r.readline().strip()
+                if header.isdigit() and int(header) == mtime:
+                    # Written by someone else using this same folder.
+                    names = [line.strip() for line in r if line.strip()]
+                    if self.mtime is None:
+                        self.names = names
+                    else:
+                        # Files edited in place don't change the folder time.
+                        known, found = set(self.names), set(names)
+                        ctimes = self.file_ctimes(x for x in self.names if x in found)
+                        self.update(
+                            [x for x, ct in ctimes.items() if ct >= self.mtime],
+                            known - found,
+                            [name for name in names if name not in known],
+                        )
+                    self.mtime = mtime
+                    return self.names
+        except FileNotFoundError:
+            pass
+
+        self.rescan()
+        return self.names
+
+    def rescan(self) -> None:
+        """
+        List the folder and write the manifest again.
+
+        If the files were already known, the ones removed, added or changed
+        since the manifest was last synced are notified, keeping the order of
+        the others. Otherwise the files keep the order of the old manifest.
+        """
+        files = [f for f in self.scan_files()]
+        logging.info(f"In the folder there are {len(files)} files, rebuild manifest.")
+        files.sort(key=lambda f: f[1])
+        if self.mtime is None:
+            self.names = self.listed_order([name for name, _ in files])
+        else:
+            found = dict(files)
+            known = set(self.names)
+            self.update(
+                [x for x in self.names if found.get(x, -1) >= self.mtime],
+                known.difference(found),
+                [name for name, _ in files if name not in known],
+            )
+        self.write_manifest()
+
+    def listed_order(self, names: List[str]) -> List[str]:
+        """
+        Sort the names like the manifest lists them, even if it's stale, with
+        the ones it doesn't list after them in the given order.
+
+        Moving a file, as migrate_to_shards does, resets its change time, so
+        only the manifest keeps the order. Files are matched without their
+        shard, so a migration interrupted before the manifest is written
+        keeps the order too.
+        """
+        try:
+            with open(self.manifest_path(), "r", encoding="utf-8") as r:
+                r.readline()
+                listed = [os.path.basename(line.strip()) for line in r]
+        except FileNotFoundError:
+            return names
+
+        positions = {name: i for i, name in enumerate(listed) if name}
+        return sorted(
+            names, key=lambda x: positions.get(os.path.basename(x), len(positions))
         )
-        return names
+
+    def collect(self, own: Iterable[str] = ()) -> None:
+        """
+        Add the files told by the watcher to the changed ones, besides the
+        ones just written by the repository itself.
+
+        :param own: Names of the files written by the repository.
+        :type own: Iterable[str]
+        """
+        if self.watcher is None or not self.watcher.available:
+            return
+
+        changed = self.watcher.changes()
+        if changed is None:
+            self.lost = True
+        else:
+            changed.discard(self.manifest_name)
+            self.changed |= changed.difference(own)
+
+    def read_changed(self) -> None:
+        """
+        Notify the files told by the watcher, comparing them with the known
+        ones.
+        """
+        changed, self.changed = self.changed, set()
+        existing = self.file_ctimes(changed)
+        known = set(self.names)
+        removed = {x for x in changed if x in known and x not in existing}
+        added = sorted((x for x in existing if x not in known), key=existing.get)
+        self.update([x for x in self.names if x in existing], removed, added)
+        if removed or added or self.mtime != self.folder_mtime():
+            self.write_manifest()
+
+    def file_ctimes(self, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Return the change time in nanoseconds of the given files, skipping the
+        ones not in the folder anymore.
+        """
+        ctimes: Dict[str, int] = {}
+        for name in names:
+            try:
+                ctimes[name] = os.stat(Path(self.folder, name)).st_ctime_ns
+            except FileNotFoundError:
+                pass
+        return ctimes
+
+    def update(self, changed: List[str], removed: Set[str], added: List[str]) -> None:
+        """
+        Change the known names like someone else changed the folder,
+        notifying the listeners and reading only the files changed or added.
+
+        :param changed: Known files whose content changed.
+        :type changed: List[str]
+        :param removed: Known files not in the folder anymore.
+        :type removed: Set[str]
+        :param added: New files, from the oldest to the newest.
+        :type added: List[str]
+        """
+        names = self.names
+        positions = {name: i for i, name in enumerate(names)}
+        formatter = ContactFolderFormatter()
+        for name in changed:
+            if name not in removed and (c := self.read_changed_file(name, formatter)):
+                self.notify(ContactChange.UPDATED, len(names) - 1 - positions[name], c)
+
+        # From the newest, so the index of the others doesn't change.
+        for i in sorted((positions[name] for name in removed), reverse=True):
+            del names[i]
+            self.notify(ContactChange.REMOVED, len(names) - i, Contact())
+
+        for name in added:
+            if c := self.read_changed_file(name, formatter):
+                names.append(name)
+                self.notify(ContactChange.INSERTED, 0, c)
+
+        logging.info(
+            f"Reloaded {len(changed)} changed, {len(removed)} removed and "
+            f"{len(added)} added files of {self.folder}"
+        )
+
+    def read_changed_file(
+        self, name: str, formatter: ContactFolderFormatter
+    ) -> Optional[Contact]:
+        """
+        Read a file changed by someone else, None if it can't be read yet.
+        """
+        try:
+            return self.load_contact(Path(self.folder, name), formatter)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Can't read changed file {name} due to {e}")
+            return None
+
+    def refresh(self) -> None:
+        self.flush()
+        if self.watcher is None:
+            self.watcher = ChangeWatcher(self.folder)
+        self.manifest()
+
+    def sorted_files(self, offset: int = 0, limit: Optional[int] = None):
+        """
+        List the files from the newest to the oldest, optionally only a page.
+        """
+        names = self.manifest()
+        stop = len(names) if limit is None else min(len(names), offset + limit)
+        return [names[-1 - i] for i in range(offset, stop)]
+
+    def file_at(self, id: int) -> Path:
+        """
+        Return the path of the contact at the given position.
+        """
+        names = self.manifest()
+        path = Path(self.folder, names[-1 - id])
+        if not path.is_file():
+            self.removed_by_others(path)
+            path = Path(self.folder, self.names[-1 - id])
+        return path
+
+    def removed_by_others(self, path: Path) -> None:
+        """
+        List the folder again after a known file was found missing, removed by
+        someone else without changing the folder time, as inside a shard.
+        """
+        logging.info(f"{path} was removed by someone else, rebuild manifest.")
+        self.rescan()
+
+    def new_name(self) -> str:
+        """
+        Return a unique name for a new contact file, inside its shard if the
+        folder is sharded.
+        """
+        name = f"{uuid.uuid4()}.txt"
+        return self.shard(name) if self.sharded else name
+
+    def shard(self, name: str) -> str:
+        """
+        Return the path of the file inside its shard, like ab/cd/abcdef.txt.
+        """
+        return f"{name[0:2]}/{name[2:4]}/{name}"
 
     def append(self, c):
         base_path = Path(self.folder)
         if base_path.is_dir():
-            fullpath = Path(base_path, str(uuid.uuid4()))
-            fullpath = fullpath.with_suffix(".txt")
-            with open(fullpath, "w", encoding="utf-8") as w:
-                file = ContactFolderFormatter().get(c)
-                w.writelines(file)
+            self.buffer.add(c)
+
+            # The newest contact comes first.
+            self.notify(ContactChange.INSERTED, 0, c)
+            return 0
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        saved = list(contacts)
+        self.flush()
+        self.write_contacts(saved)
+        for c in saved:
+            # The newest contact comes first.
+            self.notify(ContactChange.INSERTED, 0, c)
+        return [i for i in reversed(range(len(saved)))]
 
-            index = sum(1 for _ in self.list_files())
-            logging.info(f"Folder length is {index}")
+    def write_contacts(self, contacts: List[Contact]) -> None:
+        """
+        Write a file for each contact and add them to the manifest at once,
+        without notifying them.
+        """
+        names = self.manifest()
+        added = []
+        formatter = ContactFolderFormatter()
+        for c in contacts:
+            name = self.new_name()
+            fullpath = Path(self.folder, name)
+            fullpath.parent.mkdir(parents=True, exist_ok=True)
+            self.save_contact(fullpath, c, formatter)
+            added.append(name)
 
-            return index
+        names.extend(added)
+        self.mtime = self.folder_mtime()
+        with open(self.manifest_path(), "r+", encoding="utf-8") as m:
+            m.write(f"{self.mtime:0{self.header_width}d}\n")
+            m.seek(0, os.SEEK_END)
+            m.writelines(f"{name}\n" for name in added)
 
-    def items(self):
-        logging.info("Reading contact from folder")
+        if self.fsync != "none":
+            paths = [os.path.join(self.folder, name) for name in added]
+            fsync_paths([*paths, self.manifest_path()])
+        self.collect(added)
+        logging.debug("Folder length is %d", len(names))
+
+    def flush(self) -> None:
+        """
+        Write the appended contacts still waiting in the buffer.
+        """
+        self.buffer.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.watcher is not None:
+            self.watcher.close()
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        self.flush()
+        formatter = ContactFolderFormatter()
+        contacts = []
+        for id in ids:
+            contacts.append(self.load_contact(self.file_at(id), formatter))
+        return contacts
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        self.flush()
+        ids = list(ids)
+        names = self.manifest()
+        for id in ids:
+            if not (path := Path(self.folder, names[-1 - id])).is_file():
+                self.removed_by_others(path)
+                break
+
+        positions = range(len(names))
+        indexes = [positions[-1 - id] for id in ids]
+        removed = set(indexes)
+        if len(removed) != len(indexes):
+            raise ValueError("Can't remove the same contact twice.")
+
+        formatter = ContactFolderFormatter()
+        contacts = []
+        for i in indexes:
+            full_path = Path(self.folder, names[i])
+            contacts.append(self.load_contact(full_path, formatter))
+            full_path.unlink()
+
+        positions = [len(names) - 1 - i for i in indexes]
+        self.collect(names[i] for i in indexes)
+        names[:] = [name for i, name in enumerate(names) if i not in removed]
+        self.write_manifest()
+        for id, c in sorted(zip(positions, contacts), key=lambda x: x[0], reverse=True):
+            self.notify(ContactChange.REMOVED, id, c)
+        return contacts
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        for id, c in dict(changes).items():
+            self.set(id, c)
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        logging.debug("Reading contact from folder")
+        self.flush()
         formatter = ContactFolderFormatter()
         base_path = Path(self.folder)
         if base_path.is_dir():
-            names = self.sorted_files()
+            names = self.sorted_files(offset, limit)
+
+            if offset == 0:
+                try:
+                    if first := names[0]:
+                        ct = os.path.getctime(os.path.join(base_path, first))
+                        c = datetime.datetime.fromtimestamp(ct)
+                        logging.info(f"Last file created was {first} at {c}")
+                except IndexError as i:
+                    logging.error(f"No items found in base folder {i}")
+                except FileNotFoundError:
+                    logging.info(f"Last file {first} was removed by someone else")
+
+            paths = (Path(base_path, name).with_suffix(".txt") for name in names)
+            missing: Optional[Path] = None
+            if self.workers <= 1:
+                for full_path in paths:
+                    if c := self.read_file(full_path, formatter):
+                        yield c
+                    else:
+                        missing = full_path
+                if missing:
+                    self.removed_by_others(missing)
+                return
 
+            # Keep up to prefetch reads running, yielding them in order.
+            executor = ThreadPoolExecutor(self.workers, "contact-folder-reader")
             try:
-                if first := names[0]:
-                    ct = os.path.getctime(os.path.join(base_path, first))
-                    c = datetime.datetime.fromtimestamp(ct)
-                    logging.info(
-                        f"Last file created was {first} at {c}"
-                    )
-            except IndexError as i:
-                logging.error(f"No items found in base folder {i}")
-
-            for name in names:
-                full_path = Path(base_path, name).with_suffix(".txt")
-                if full_path.is_file():
-                    with open(full_path, "r", encoding="utf-8") as r:
-                        file_content = r.readlines()
-                        logging.info(f"Reading {full_path} for {file_content}")
-                        yield formatter.set(file_content)
-                else:
-                    logging.warning("Why it's not a file?")
-                    
+                pending = deque(
+                    (p, executor.submit(self.read_file, p, formatter))
+                    for p in islice(paths, self.prefetch)
+                )
+                while pending:
+                    full_path, future = pending.popleft()
+                    c = future.result()
+                    for p in islice(paths, 1):
+                        future = executor.submit(self.read_file, p, formatter)
+                        pending.append((p, future))
+                    if c:
+                        yield c
+                    else:
+                        missing = full_path
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            if missing:
+                self.removed_by_others(missing)
+
+    def read_file(
+        self, full_path: Path, formatter: ContactFolderFormatter
+    ) -> Optional[Contact]:
+        """
+        Read the contact in the given file, None if it's not a file.
+        """
+        if full_path.is_file():
+            try:
+                return self.load_contact(full_path, formatter)
+            except FileNotFoundError:
+                pass
+
+        logging.warning("Why it's not a file?")
+        return None
+
+    def load_contact(
+        self, full_path: Path, formatter: ContactFolderFormatter
+    ) -> Contact:
+        """
+        Read the contact saved in the given file.
+        """
+        data = full_path.read_bytes()
+        self.bytes_read += len(data)
+        logging.debug("Reading %s for %s", full_path, data)
+        return formatter.set(data.decode("utf-8").splitlines(keepends=True))
+
+    def save_contact(
+        self, full_path: Path, c: Contact, formatter: ContactFolderFormatter
+    ) -> None:
+        """
+        Write the contact in the given file, replacing its content.
+        """
+        data = formatter.get(c).encode("utf-8")
+        full_path.write_bytes(data)
+        self.bytes_written += len(data)
 
     def pop(self, id):
+        self.flush()
         base_path = Path(self.folder)
         if base_path.is_dir():
-            files = [f for f in self.sorted_files()]
-            if selected := files[id]:
-                full_path = Path(base_path, selected).with_suffix(".txt")
-                if full_path.is_file():
-                    with open(full_path, "r", encoding="utf-8") as r:
-                        c = ContactFolderFormatter().set(r.readlines())
+            try:
+                full_path = self.file_at(id)
+            except IndexError:
+                full_path = None
 
-                    full_path.unlink()
-                    return c
+            names = self.names
+            if full_path and full_path.is_file():
+                c = self.load_contact(full_path, ContactFolderFormatter())
+
+                full_path.unlink()
+                self.collect([names[-1 - id]])
+                del names[-1 - id]
+                self.write_manifest()
+                self.notify(ContactChange.REMOVED, range(len(names) + 1)[id], c)
+                return c
 
             raise IndexError("Index out of bound exception or the file does not exists")
 
         raise ValueError("Missing base folder")
 
+    def count(self) -> int:
+        self.flush()
+        return len(self.manifest())
+
     def get(self, id):
+        self.flush()
         base_path = Path(self.folder)
         if base_path.is_dir():
-            files = [f for f in self.sorted_files()]
-            if selected := files[id]:
-                full_path = Path(base_path, selected).with_suffix(".txt")
-                with open(full_path, "r", encoding="utf-8") as r:
-                    return ContactFolderFormatter().set(r.readlines())
+            full_path = self.file_at(id)
+            return self.load_contact(full_path, ContactFolderFormatter())
 
     def set(self, id, c):
+        self.flush()
         base_path = Path(self.folder)
         if base_path.is_dir():
-            files = [f for f in self.sorted_files()]
-            if selected := files[id]:
-                full_path = Path(base_path, selected).with_suffix(".txt")
-                with open(full_path, "w", encoding="utf-8") as w:
-                    string = ContactFolderFormatter().get(c)
-                    w.writelines(string)
+            full_path = self.file_at(id)
+            self.save_contact(full_path, c, ContactFolderFormatter())
+            if self.fsync != "none":
+                fsync_paths([str(full_path)])
+            self.collect([self.names[-1 - id]])
+            self.notify(ContactChange.UPDATED, range(len(self.names))[id], c)
+
+    def migrate_to_shards(self) -> int:
+        """
+        Move every file in the root of the folder inside its shard, keeping
+        the order of the contacts.
+
+        :return: Number of moved files.
+        :rtype: int
+        """
+        self.flush()
+        names = self.manifest()
+        moved = 0
+        for i, name in enumerate(names):
+            if "/" in name:
+                continue
+
+            target = Path(self.folder, self.shard(name))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(Path(self.folder, name), target)
+            names[i] = self.shard(name)
+            self.collect([name, names[i]])
+            moved += 1
+
+        self.write_manifest()
+        logging.info(f"Moved {moved} files of {len(names)} in shards")
+        return moved
+
+
+class ContactShardedFolderRepository(ContactFolderRepository):
+    """
+    Save contacts in a file for each contact, spread in subfolders like
+    ab/cd/<uuid>.txt to keep each directory small with millions of contacts.
+
+    Only the root folder time is checked against the manifest, so without a
+    ChangeWatcher files added in an existing shard by someone else are seen
+    after the manifest is rebuilt. A file removed by someone else is found
+    missing when read, and the folder is listed again.
+
+    >>> import tempfile, time
+    >>> flat = ContactFolderRepository(os.path.join(tempfile.mkdtemp(), "informazioni"))
+    >>> flat.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    0
+    >>> repo = ContactShardedFolderRepository(flat.folder)
+    >>> repo.append(Contact("quinto", "sesto", "settimo", "ottavo", 9))
+    0
+    >>> repo.migrate_to_shards()
+    1
+    >>> [x.first_name for x in ContactShardedFolderRepository(flat.folder).items()]
+    ['quinto', 'primo']
+    >>> time.sleep(0.01)  # let the folder time change, the manifest is stale then
+    >>> os.mkdir(os.path.join(flat.folder, "vuota"))
+    >>> os.rmdir(os.path.join(flat.folder, "vuota"))
+    >>> [x.first_name for x in ContactShardedFolderRepository(flat.folder).items()]
+    ['quinto', 'primo']
+    >>> ContactShardedFolderRepository(flat.folder).pop(0).first_name
+    'quinto'
+    >>> repo.get(0).first_name, repo.count()
+    ('primo', 1)
+    """
+
+    sharded = True
@@ -0,0 +1,243 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_query import Condition
+from py_phone.repository.contact_repository import ContactRepository
+
+
+class OperationStats:
+    """
+    Calls, latencies and bytes moved by an operation of a repository.
+
+    Latencies are counted in a histogram of power of two buckets, so recording
+    a call costs the same however many calls were recorded.
+
+    >>> stats = OperationStats()
+    >>> stats.record(0.000003, 10, 0)
+    >>> stats.record(0.000100, 0, 20)
+    >>> stats.calls, stats.bytes_read, stats.bytes_written
+    (2, 10, 20)
+    >>> stats.percentile(0.5), stats.percentile(0.99)
+    (4, 128)
+    """
+
+    buckets = 40
+    """
+    Bucket i counts the calls faster than 2 ** i microseconds.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.histogram: List[int] = [0] * self.buckets
+
+    def record(
+        self, seconds: float, read: int, written: int, failed: bool = False
+    ) -> None:
+        """
+        Add a call to the statistics.
+
+        :param seconds: Time spent in the call.
+        :type seconds: float
+        :param read: Bytes read from the storage during the call.
+        :type read: int
+        :param written: Bytes written to the storage during the call.
+        :type written: int
+        :param failed: The call raised an exception.
+        :type failed: bool
+        """
+        self.calls += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes_read += read
+        self.bytes_written += written
+        bucket = int(seconds * 1e6).bit_length()
+        self.histogram[min(bucket, self.buckets - 1)] += 1
+
+    def percentile(self, q: float) -> int:
+        """
+        Return the upper bound, in microseconds, of the bucket holding the
+        given quantile of the calls.
+        """
+        rank = q * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return 2**bucket
+        return 0
+
+
+class InstrumentedContactRepository(ContactRepository):
+    """
+    Measure every operation done on another repository.
+
+    Each call is timed and counted with the bytes read and written by the
+    wrapped repository meanwhile, for the backends that count them. items()
+    is measured from the first to the last contact read, without the time
+    spent by the caller between two contacts.
+
+    >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("primo"), Contact("secondo")]
+    >>> repo = InstrumentedContactRepository(mem)
+    >>> repo.get(1)
+    Contact("secondo", "", "", "", None)
+    >>> [x.first_name for x in repo.items()]
+    ['primo', 'secondo']
+    >>> repo.stats["get"].calls, repo.stats["items"].calls
+    (1, 1)
+    """
+
+    def __init__(self, phonebook: ContactRepository):
+        """
+        Wrap a repository to measure it.
+
+        :param phonebook: Repository to measure.
+        :type phonebook: ContactRepository
+        """
+        super().__init__()
+        self.phonebook = phonebook
+        self.stats: Dict[str, OperationStats] = {}
+        self.lock = threading.Lock()
+        self.phonebook.subscribe(self.notify)
+
+    def measure(self, op: str, call: Callable[[], Any]) -> Any:
+        """
+        Run call, recording it under the operation op.
+        """
+        read, written = self.phonebook.bytes_read, self.phonebook.bytes_written
+        failed = True
+        start = time.perf_counter()
+        try:
+            result = call()
+            failed = False
+            return result
+        finally:
+            self.record(op, time.perf_counter() - start, read, written, failed)
+
+    def record(
+        self, op: str, seconds: float, read: int, written: int, failed: bool
+    ) -> None:
+        """
+        Add a call to the statistics of op, given the counters of the wrapped
+        repository before the call.
+        """
+        with self.lock:
+            if op not in self.stats:
+                self.stats[op] = OperationStats()
+            self.stats[op].record(
+                seconds,
+                self.phonebook.bytes_read - read,
+                self.phonebook.bytes_written - written,
+                failed,
+            )
+
+    def append(self, c: Contact) -> int:
+        return self.measure("append", lambda: self.phonebook.append(c))
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        read, written = self.phonebook.bytes_read, self.phonebook.bytes_written
+        contacts = self.phonebook.items(offset, limit)
+        elapsed = 0.0
+        failed = False
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    c = next(contacts)
+                except StopIteration:
+                    return
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield c
+        finally:
+            contacts.close()
+            self.record("items", elapsed, read, written, failed)
+
+    def count(self) -> int:
+        return self.measure("count", lambda: self.phonebook.count())
+
+    def pop(self, id: int) -> Contact:
+        return self.measure("pop", lambda: self.phonebook.pop(id))
+
+    def get(self, id: int) -> Contact:
+        return self.measure("get", lambda: self.phonebook.get(id))
+
+    def set(self, id: int, c: Contact):
+        return self.measure("set", lambda: self.phonebook.set(id, c))
+
+    def query(
+        self,
+        conditions: Iterable[Condition] = (),
+        order_by: Optional[str] = None,
+        reverse: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, Contact]]:
+        return self.measure(
+            "query",
+            lambda: self.phonebook.query(conditions, order_by, reverse, offset, limit),
+        )
+
+    @property
+    def newest_first(self) -> bool:
+        return self.phonebook.newest_first
+
+    def frozen(self):
+        return self.phonebook.frozen()
+
+    def close(self) -> None:
+        self.measure("close", lambda: self.phonebook.close())
+
+    def refresh(self) -> None:
+        self.measure("refresh", lambda: self.phonebook.refresh())
+
+    def find_by_telephone(self, number: str) -> List[Tuple[int, Contact]]:
+        return self.measure(
+            "find_by_telephone", lambda: self.phonebook.find_by_telephone(number)
+        )
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        return self.measure(
+            "append_many", lambda: self.phonebook.append_many(contacts)
+        )
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        return self.measure("get_many", lambda: self.phonebook.get_many(ids))
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        return self.measure("pop_many", lambda: self.phonebook.pop_many(ids))
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        self.measure("set_many", lambda: self.phonebook.set_many(changes))
+
+    def report(self) -> str:
+        """
+        Return a table with the statistics of every operation called.
+        """
+        lines = [
+            f"{'op':>12} {'calls':>8} {'errors':>6} {'avg_us':>10} {'p50_us':>8} "
+            f"{'p99_us':>8} {'max_us':>10} {'read_b':>12} {'written_b':>12}"
+        ]
+        with self.lock:
+            for op, s in sorted(self.stats.items()):
+                avg = s.total / s.calls * 1e6 if s.calls else 0.0
+                lines.append(
+                    f"{op:>12} {s.calls:>8} {s.errors:>6} {avg:>10.1f} "
+                    f"{s.percentile(0.5):>8} {s.percentile(0.99):>8} "
+                    f"{s.max * 1e6:>10.1f} {s.bytes_read:>12} {s.bytes_written:>12}"
+                )
+        return "\n".join(lines)
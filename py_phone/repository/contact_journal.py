@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+from typing import IO, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.write_buffer import fsync_policies
+
+
+class ContactJournal:
+    """
+    Persist a list of contacts kept in memory with a snapshot and a journal.
+
+    Every change is appended to the journal as a line of JSON with a sequence
+    number. After snapshot_every records the whole list is saved in the
+    snapshot, also as lines of JSON: a header with the sequence number of the
+    last record it contains and the number of contacts, then a line for each
+    contact. Then the journal starts again empty. Loading reads the snapshot
+    and replays only the records after it, so a crash between the two steps
+    doesn't apply a record twice. A broken record at the end of the journal,
+    left by a crash while writing it, is cut away.
+
+    >>> import tempfile
+    >>> journal = ContactJournal(os.path.join(tempfile.mkdtemp(), "informazioni"), 2)
+    >>> contacts = journal.load()
+    >>> contacts.append(Contact("primo"))
+    >>> journal.write([journal.append(contacts[0])])
+    >>> contacts[0] = Contact("secondo")
+    >>> journal.write([journal.set(0, contacts[0])])
+    >>> journal.due()
+    True
+    >>> journal.snapshot(contacts)
+    >>> del contacts[0]
+    >>> journal.write([journal.pop(0)])
+    >>> journal.load()
+    []
+    >>> with open(journal.snapshot_path, "a", encoding="utf-8") as w:
+    ...     _ = w.write('["altro"]' + os.linesep)
+    >>> journal.load()  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: The snapshot ... is broken.
+    """
+
+    def __init__(
+        self, path: str, snapshot_every: int = 10_000, fsync: str = "batch"
+    ):
+        """
+        :param path: Path of the files without the extension: the snapshot is
+            saved in path.snapshot and the journal in path.journal.
+        :type path: str
+        :param snapshot_every: Records written before saving a snapshot.
+        :type snapshot_every: int
+        :param fsync: One of fsync_policies.
+        :type fsync: str
+        """
+        if fsync not in fsync_policies:
+            raise ValueError(f"Unknown fsync policy {fsync}.")
+        self.snapshot_path = f"{path}.snapshot"
+        self.journal_path = f"{path}.journal"
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.sequence = 0
+        """
+        Sequence number of the last record written.
+        """
+
+        self.records = 0
+        """
+        Records written in the journal after the last snapshot.
+        """
+
+        self.file: Optional[IO[bytes]] = None
+
+    @staticmethod
+    def append(c: Contact) -> list:
+        """
+        Return the record of a contact appended.
+        """
+        return ["a", *c.fields()]
+
+    @staticmethod
+    def set(id: int, c: Contact) -> list:
+        """
+        Return the record of a contact changed at a position.
+        """
+        return ["s", id, *c.fields()]
+
+    @staticmethod
+    def pop(id: int) -> list:
+        """
+        Return the record of the contact removed from a position.
+        """
+        return ["p", id]
+
+    def apply(self, contacts: List[Contact], record: list) -> None:
+        """
+        Apply a record to the list of contacts.
+        """
+        if record[0] == "a":
+            contacts.append(Contact(*record[1:]))
+        elif record[0] == "s":
+            contacts[record[1]] = Contact(*record[2:])
+        else:
+            del contacts[record[1]]
+
+    def load(self) -> List[Contact]:
+        """
+        Return the contacts saved in the snapshot with the changes of the
+        journal, and open the journal to write.
+        """
+        contacts: List[Contact] = []
+        self.sequence = 0
+        if os.path.isfile(self.snapshot_path):
+            self.sequence, contacts = self.read_snapshot()
+
+        self.records = 0
+        position = 0
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "rb") as r:
+                for line in r:
+                    try:
+                        sequence, *record = json.loads(line)
+                        if not isinstance(sequence, int) or not record:
+                            raise ValueError("missing sequence number")
+                    except (TypeError, ValueError):
+                        logging.error(
+                            f"Cutting broken record at {position} "
+                            f"of {self.journal_path}"
+                        )
+                        break
+                    if sequence > self.sequence:
+                        self.apply(contacts, record)
+                        self.sequence = sequence
+                        self.records += 1
+                    position += len(line)
+
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.journal_path, "ab")
+        self.file.truncate(position)
+        logging.info(
+            f"Loaded {len(contacts)} contacts, {self.records} from the journal"
+        )
+        return contacts
+
+    def read_snapshot(self) -> Tuple[int, List[Contact]]:
+        """
+        Return the sequence number and the contacts saved in the snapshot.
+
+        The snapshot is written with a rename, so it's never left half
+        written: if it's broken someone else changed it, and it's an error.
+        """
+        with open(self.snapshot_path, "r", encoding="utf-8") as r:
+            try:
+                sequence, count = json.loads(r.readline())
+                rows = [json.loads(line) for line in r]
+                valid = (
+                    isinstance(sequence, int)
+                    and sequence >= 0
+                    and count == len(rows)
+                    and all(isinstance(x, list) and len(x) == 5 for x in rows)
+                )
+            except (TypeError, ValueError):
+                valid = False
+        if not valid:
+            raise ValueError(f"The snapshot {self.snapshot_path} is broken.")
+        return sequence, [Contact(*row) for row in rows]
+
+    def sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write(self, records: List[list]) -> None:
+        """
+        Append the records of a change to the journal.
+        """
+        for record in records:
+            self.sequence += 1
+            line = json.dumps([self.sequence, *record], ensure_ascii=False)
+            self.file.write(line.encode("utf-8") + b"\n")
+            if self.fsync == "write":
+                self.sync()
+        self.records += len(records)
+        if self.fsync == "batch":
+            self.sync()
+        else:
+            self.file.flush()
+
+    def due(self) -> bool:
+        """
+        Tell if it's time to save a snapshot.
+        """
+        return self.records >= self.snapshot_every
+
+    def snapshot(self, contacts: List[Contact]) -> None:
+        """
+        Save all the contacts in the snapshot and empty the journal.
+        """
+        rows = [c.fields() for c in contacts]
+        temp = f"{self.snapshot_path}.tmp"
+        with open(temp, "w", encoding="utf-8") as w:
+            w.write(json.dumps([self.sequence, len(rows)]) + "\n")
+            w.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            if self.fsync != "none":
+                w.flush()
+                os.fsync(w.fileno())
+        os.replace(temp, self.snapshot_path)
+
+        self.file.truncate(0)
+        self.records = 0
+        logging.info(f"Saved a snapshot of {len(rows)} contacts")
+
+    def close(self) -> None:
+        """
+        Close the journal.
+        """
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
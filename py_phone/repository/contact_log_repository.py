@@ -0,0 +1,322 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_file_repository import ContactFileFormatter
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+
+
+class ContactLogRepository(ContactRepository):
+    """
+    Save contacts in an append-only log file.
+
+    Every record has a key, assigned when the contact is appended. An update
+    appends a new version of the record with the same key, a delete appends a
+    tombstone, so writes never rewrite the file. Reads resolve the latest
+    version of each key. When the ratio of dead records in the log goes over
+    garbage_ratio, the log is compacted in a background thread.
+
+    >>> import tempfile
+    >>> repo = ContactLogRepository(os.path.join(tempfile.mkdtemp(), "informazioni.log"))
+    >>> repo.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    0
+    >>> repo.append(Contact("quinto", "sesto", "settimo", "ottavo", 9))
+    1
+    >>> repo.set(0, Contact("nono", "decimo", "undicesimo", "dodicesimo", 12))
+    >>> repo.pop(1)
+    Contact("quinto", "sesto", "settimo", "ottavo", 9)
+    >>> [x for x in repo.items()]
+    [Contact("nono", "decimo", "undicesimo", "dodicesimo", 12)]
+    >>> repo.garbage()
+    3
+    >>> repo.compact()
+    >>> repo.garbage()
+    0
+    """
+
+    put = "+"
+    """
+    Marker of a record with a contact.
+    """
+
+    tombstone = "-"
+    """
+    Marker of a record deleting a contact.
+    """
+
+    def __init__(
+        self,
+        file: str = "informazioni.log",
+        garbage_ratio: float = 0.5,
+        min_records: int = 1000,
+        background: bool = True,
+    ):
+        """
+        Open the log, creating it if missing.
+
+        :param file: Path of the log file.
+        :type file: str
+        :param garbage_ratio: Ratio of dead records that triggers compaction.
+        :type garbage_ratio: float
+        :param min_records: Don't compact logs smaller than this.
+        :type min_records: int
+        :param background: Run compaction in a separate thread.
+        :type background: bool
+        """
+        super().__init__()
+        self.file = file
+        self.garbage_ratio = garbage_ratio
+        self.min_records = min_records
+        self.background = background
+        if not os.path.isfile(self.file):
+            with open(self.file, "w", encoding="utf-8") as w:
+                w.write("")
+
+        self.lock = threading.RLock()
+        self.compaction: Optional[threading.Thread] = None
+
+        self.live: Dict[int, int] = {}
+        """
+        Offset of the latest version of each live key.
+        """
+
+        self.keys: List[int] = []
+        """
+        Live keys, in the order of the contacts.
+        """
+
+        self.records = 0
+        """
+        Number of records in the log, dead ones included.
+        """
+
+        self.next_key = 0
+        self.signature: Optional[Tuple[int, int]] = None
+
+    def stat_signature(self) -> Tuple[int, int]:
+        """
+        Return modification time and size of the log, used to detect changes.
+        """
+        stat = os.stat(self.file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def apply(self, line: bytes, offset: int, live: Dict[int, int]) -> bool:
+        """
+        Apply a record of the log to the live keys.
+
+        :return: True if the line was a record, False if it was empty or broken.
+        :rtype: bool
+        """
+        fields = line.decode("utf-8").split(ContactFileFormatter.separator, 2)
+        try:
+            key = int(fields[1])
+        except (IndexError, ValueError):
+            if line.strip():
+                logging.error(f"Skipping broken record at {offset} of {self.file}")
+            return False
+
+        if fields[0] == self.put:
+            live[key] = offset
+        elif fields[0] == self.tombstone:
+            live.pop(key, None)
+        self.next_key = max(self.next_key, key + 1)
+        return True
+
+    def load(self) -> None:
+        """
+        Read again the whole log if it changed since the last time.
+        """
+        with self.lock:
+            signature = self.stat_signature()
+            if signature == self.signature:
+                return
+
+            live: Dict[int, int] = {}
+            records = 0
+            position = 0
+            with open(self.file, "rb") as r:
+                for line in r:
+                    if self.apply(line, position, live):
+                        records += 1
+                    position += len(line)
+
+            self.bytes_read += position
+            logging.info(f"Loaded {len(live)} contacts of {records} records")
+            self.live = live
+            self.keys = sorted(live)
+            self.records = records
+            self.signature = signature
+
+    def write(self, line: str) -> int:
+        """
+        Append a record at the end of the log.
+
+        :return: Offset of the record.
+        :rtype: int
+        """
+        data = line.encode("utf-8") + b"\n"
+        with open(self.file, "ab") as a:
+            offset = a.tell()
+            a.write(data)
+
+        self.bytes_written += len(data)
+        self.records += 1
+        self.signature = self.stat_signature()
+        return offset
+
+    def read(self, offset: int) -> Contact:
+        """
+        Read the contact of the record at the given offset.
+        """
+        with open(self.file, "rb") as r:
+            r.seek(offset)
+            line = r.readline()
+            self.bytes_read += len(line)
+            return self.parse(line)
+
+    def parse(self, line: bytes) -> Contact:
+        """
+        Convert a record of the log to a contact.
+        """
+        payload = line.decode("utf-8").split(ContactFileFormatter.separator, 2)[2]
+        return ContactFileFormatter().set(payload)
+
+    def record(self, key: int, c: Contact) -> str:
+        """
+        Convert a contact to a record of the log.
+        """
+        sep = ContactFileFormatter.separator
+        return f"{self.put}{sep}{key}{sep}{ContactFileFormatter().format(c)}"
+
+    def append(self, c: Contact) -> int:
+        with self.lock:
+            self.load()
+            key = self.next_key
+            self.next_key += 1
+            self.live[key] = self.write(self.record(key, c))
+            self.keys.append(key)
+            index = len(self.keys) - 1
+            logging.debug("Appended contact %s at %d", c.label(), index)
+            self.notify(ContactChange.INSERTED, index, self.read(self.live[key]))
+            return index
+
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        stop = None if limit is None else offset + limit
+        with self.lock:
+            self.load()
+            offsets = [self.live[k] for k in self.keys[offset:stop]]
+            r = open(self.file, "rb")
+
+        with r:
+            for offset in offsets:
+                r.seek(offset)
+                line = r.readline()
+                self.bytes_read += len(line)
+                try:
+                    yield self.parse(line)
+                except ValueError as v:
+                    logging.error(f"Can't yield contact due to {v}")
+
+    def count(self) -> int:
+        with self.lock:
+            self.load()
+            return len(self.keys)
+
+    def pop(self, id: int) -> Contact:
+        with self.lock:
+            self.load()
+            id = range(len(self.keys))[id]
+            key = self.keys[id]
+            c = self.read(self.live[key])
+            self.write(f"{self.tombstone}{ContactFileFormatter.separator}{key}")
+            del self.keys[id]
+            del self.live[key]
+            self.notify(ContactChange.REMOVED, id, c)
+            self.maybe_compact()
+            return c
+
+    def get(self, id: int) -> Contact:
+        with self.lock:
+            self.load()
+            return self.read(self.live[self.keys[id]])
+
+    def set(self, id: int, c: Contact):
+        with self.lock:
+            self.load()
+            id = range(len(self.keys))[id]
+            key = self.keys[id]
+            self.live[key] = self.write(self.record(key, c))
+            logging.debug("Update record %d at %d", key, id)
+            self.notify(ContactChange.UPDATED, id, self.read(self.live[key]))
+            self.maybe_compact()
+
+    def garbage(self) -> int:
+        """
+        Return the number of dead records in the log.
+        """
+        return self.records - len(self.live)
+
+    def maybe_compact(self) -> None:
+        """
+        Start a compaction if there is too much garbage in the log.
+        """
+        if self.records < self.min_records:
+            return
+        if self.garbage() / self.records <= self.garbage_ratio:
+            return
+        if self.compaction is not None and self.compaction.is_alive():
+            return
+
+        if self.background:
+            self.compaction = threading.Thread(target=self.compact, daemon=True)
+            self.compaction.start()
+        else:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Rewrite the log keeping only the latest version of the live records.
+
+        Live records are copied without holding the lock, so the repository can
+        be used meanwhile. Records written during the copy are moved to the new
+        log before replacing the old one.
+        """
+        temp = f"{self.file}.compact"
+        try:
+            with self.lock:
+                self.load()
+                snapshot = [(k, self.live[k]) for k in self.keys]
+                end = self.signature[1]
+
+            live: Dict[int, int] = {}
+            with open(self.file, "rb") as r, open(temp, "wb") as w:
+                for key, offset in snapshot:
+                    r.seek(offset)
+                    live[key] = w.tell()
+                    w.write(r.readline())
+
+                with self.lock:
+                    # Move what has been written in the meantime.
+                    records = len(live)
+                    r.seek(end)
+                    for line in r:
+                        position = w.tell()
+                        w.write(line)
+                        if self.apply(line, position, live):
+                            records += 1
+
+                    self.bytes_read += w.tell()
+                    self.bytes_written += w.tell()
+                    w.close()
+                    os.replace(temp, self.file)
+                    self.live = live
+                    self.keys = sorted(live)
+                    self.records = records
+                    self.signature = self.stat_signature()
+                    logging.info(f"Compacted log to {records} records")
+        except OSError as e:
+            logging.error(f"Can't compact {self.file} due to {e}")
+            if os.path.isfile(temp):
+                os.remove(temp)
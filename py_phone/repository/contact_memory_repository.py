@@ -1,20 +1,83 @@
 from py_phone.model.contact import Contact
-from py_phone.repository.contact_repository import ContactRepository
+from py_phone.model.contact_table import ContactTable
+from py_phone.repository.contact_journal import ContactJournal
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
 
 
+from itertools import islice
 import logging
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 class ContactMemoryRepository(ContactRepository):
     """
     Save contacts in the local memory.
+
+    With columnar, contacts are saved in a ContactTable instead of a list, to
+    take less memory with millions of contacts.
+
+    With a journal, the phonebook of the instance is loaded from a snapshot
+    and a journal of the changes, and every change is appended to the
+    journal, so contacts are kept between runs.
+
+    >>> mem = ContactMemoryRepository(columnar=True)
+    >>> mem.append(Contact("primo", "secondo", "terzo", "quarto", 5))
+    1
+    >>> mem.pop(0)
+    Contact("1234", "", "", "", None)
+    >>> mem.phonebook
+    ContactTable([Contact("primo", "secondo", "terzo", "quarto", 5)])
     """
 
-    phonebook: List[Contact] = [Contact("1234")]
+    phonebook: List[Contact] | ContactTable = [Contact("1234")]
 
-    def __init__(self):
+    def __init__(
+        self,
+        columnar: bool = False,
+        journal: Optional[str] = None,
+        snapshot_every: int = 10_000,
+        fsync: str = "batch",
+    ):
+        """
+        Open the phonebook in memory.
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "informazioni")
+        >>> mem = ContactMemoryRepository(journal=path)
+        >>> mem.append(Contact("primo"))
+        0
+        >>> mem.close()
+        >>> ContactMemoryRepository(journal=path).phonebook
+        [Contact("primo", "", "", "", None)]
+
+        :param columnar: Save the contacts in a table of columns.
+        :type columnar: bool
+        :param journal: Path of the snapshot and of the journal without the
+            extension, None to keep the contacts only in memory.
+        :type journal: Optional[str]
+        :param snapshot_every: Changes written in the journal before saving a
+            snapshot.
+        :type snapshot_every: int
+        :param fsync: When the journal is forced to the disk, one of
+            fsync_policies.
+        :type fsync: str
+        """
         super().__init__()
+        self.journal: Optional[ContactJournal] = None
+        if journal is not None:
+            self.journal = ContactJournal(journal, snapshot_every, fsync)
+            self.phonebook = self.journal.load()
+        if columnar:
+            self.phonebook = ContactTable(self.phonebook)
+
+    def record(self, records: List[list]) -> None:
+        """
+        Write the records of a change in the journal, if there is one.
+        """
+        if self.journal is not None:
+            self.journal.write(records)
+            if self.journal.due():
+                self.journal.snapshot(self.phonebook)
 
     def append(self, c: Contact) -> int:
         """
@@ -26,23 +89,104 @@ class ContactMemoryRepository(ContactRepository):
         2
         """
         self.phonebook.append(c)
-        index = self.phonebook.index(c)
-        logging.info(f"Appended contact {c.label()} at {index}")
+        index = len(self.phonebook) - 1
+        self.record([ContactJournal.append(c)])
+        logging.debug("Appended contact %s at %d", c.label(), index)
+        self.notify(ContactChange.INSERTED, index, c)
         return index
 
-    def items(self):
-        for contact in self.phonebook:
+    def items(self, offset: int = 0, limit: Optional[int] = None):
+        """
+        >>> mem = ContactMemoryRepository()
+        >>> mem.phonebook = [Contact("primo"), Contact("secondo"), Contact("terzo")]
+        >>> [x.first_name for x in mem.items(1, 1)]
+        ['secondo']
+        """
+        stop = None if limit is None else offset + limit
+        for contact in islice(self.phonebook, offset, stop):
             yield contact
 
+    def count(self) -> int:
+        return len(self.phonebook)
+
     def pop(self, id: int) -> Contact:
         """
         >>> ContactMemoryRepository().pop(0)
         Contact("1234", "", "", "", None)
         """
-        return self.phonebook.pop(id)
+        id = range(len(self.phonebook))[id]
+        c = self.phonebook.pop(id)
+        self.record([ContactJournal.pop(id)])
+        self.notify(ContactChange.REMOVED, id, c)
+        return c
 
     def get(self, id: int) -> Contact:
         return self.phonebook[id]
 
     def set(self, id: int, c: Contact) -> Contact:
+        id = range(len(self.phonebook))[id]
         self.phonebook[id] = c
+        self.record([ContactJournal.set(id, c)])
+        self.notify(ContactChange.UPDATED, id, c)
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        """
+        >>> mem = ContactMemoryRepository()
+        >>> mem.phonebook = []
+        >>> mem.append_many([Contact("primo"), Contact("secondo")])
+        [0, 1]
+        """
+        start = len(self.phonebook)
+        self.phonebook.extend(contacts)
+        self.record([ContactJournal.append(c) for c in self.phonebook[start:]])
+        logging.info(f"Appended {len(self.phonebook) - start} contacts at {start}")
+        for i in range(start, len(self.phonebook)):
+            self.notify(ContactChange.INSERTED, i, self.phonebook[i])
+        return [i for i in range(start, len(self.phonebook))]
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        return [self.phonebook[id] for id in ids]
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        """
+        >>> mem = ContactMemoryRepository()
+        >>> mem.phonebook = [Contact("primo"), Contact("secondo"), Contact("terzo")]
+        >>> mem.pop_many([2, 0])
+        [Contact("terzo", "", "", "", None), Contact("primo", "", "", "", None)]
+        >>> mem.phonebook
+        [Contact("secondo", "", "", "", None)]
+        """
+        positions = range(len(self.phonebook))
+        ids = [positions[id] for id in ids]
+        removed = set(ids)
+        if len(removed) != len(ids):
+            raise ValueError("Can't remove the same contact twice.")
+
+        popped = [self.phonebook[id] for id in ids]
+        kept = [c for i, c in enumerate(self.phonebook) if i not in removed]
+        notified = sorted(zip(ids, popped), key=lambda x: x[0], reverse=True)
+        self.phonebook[:] = kept
+        self.record([ContactJournal.pop(id) for id, _ in notified])
+        for id, c in notified:
+            self.notify(ContactChange.REMOVED, id, c)
+        return popped
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        positions = range(len(self.phonebook))
+        changes = {positions[id]: c for id, c in dict(changes).items()}
+        for id, c in changes.items():
+            self.phonebook[id] = c
+        self.record([ContactJournal.set(id, c) for id, c in changes.items()])
+        for id, c in changes.items():
+            self.notify(ContactChange.UPDATED, id, c)
+
+    def close(self) -> None:
+        """
+        Save a snapshot of the changes in the journal, then close it.
+        """
+        if self.journal is not None:
+            if self.journal.records:
+                self.journal.snapshot(self.phonebook)
+            self.journal.close()
@@ -0,0 +1,133 @@
+from typing import Any, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+
+
+def field_value(c: Contact, field: str) -> Any:
+    """
+    Return the value of a field of a contact as it's compared by a query: the
+    age as an integer, None if it's missing, and the other fields as strings.
+
+    >>> field_value(Contact("Mario", age="40"), "age")
+    40
+    >>> field_value(Contact("Mario"), "age") is None
+    True
+    """
+    value = getattr(c, field)
+    if field == "age":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return str(value)
+
+
+def check_field(field: str) -> str:
+    """
+    Return field if it's a field of the contacts, raise ValueError otherwise.
+    """
+    if field not in Contact.__slots__:
+        raise ValueError(f"Contacts don't have a field {field}.")
+    return field
+
+
+class Condition:
+    """
+    A condition on a field of the contacts, used by ContactRepository.query.
+
+    Operators are "=", "<", "<=", ">", ">=", "between" with a pair of inclusive
+    bounds, and "prefix" and "contains" for the fields that are text. Text is
+    compared as it is, upper case included. A contact without an age never
+    matches a condition on the age.
+
+    >>> Condition("age", "between", (30, 40)).matches(Contact(age=35))
+    True
+    >>> Condition("last_name", "prefix", "R").matches(Contact("Mario", "Rossi"))
+    True
+    >>> Condition("age", ">", 18).matches(Contact("Mario"))
+    False
+    """
+
+    operators = ("=", "<", "<=", ">", ">=", "between", "prefix", "contains")
+
+    def __init__(self, field: str, operator: str, value: Any):
+        """
+        :param field: Name of the field, as in Contact.
+        :type field: str
+        :param operator: One of the operators.
+        :type operator: str
+        :param value: Value to compare, a pair of values for between.
+        :type value: Any
+        """
+        self.field = check_field(field)
+        if operator not in self.operators:
+            raise ValueError(f"Unknown operator {operator}.")
+        if operator in ("prefix", "contains") and field == "age":
+            raise ValueError(f"Can't use {operator} on the age.")
+        self.operator = operator
+        if operator == "between":
+            low, high = value
+            self.value = (self.convert(low), self.convert(high))
+        else:
+            self.value = self.convert(value)
+
+    def __repr__(self):
+        return f"Condition({self.field!r}, {self.operator!r}, {self.value!r})"
+
+    def convert(self, value: Any) -> Any:
+        """
+        Convert a value to the type of the field.
+        """
+        return int(value) if self.field == "age" else str(value)
+
+    def matches(self, c: Contact) -> bool:
+        """
+        Tell if the contact satisfies the condition.
+        """
+        value = field_value(c, self.field)
+        if value is None:
+            return False
+
+        operator = self.operator
+        if operator == "=":
+            return value == self.value
+        if operator == "<":
+            return value < self.value
+        if operator == "<=":
+            return value <= self.value
+        if operator == ">":
+            return value > self.value
+        if operator == ">=":
+            return value >= self.value
+        if operator == "between":
+            return self.value[0] <= value <= self.value[1]
+        if operator == "prefix":
+            return value.startswith(self.value)
+        return self.value in value
+
+
+def order(
+    found: List[Tuple[int, Contact]],
+    order_by: Optional[str] = None,
+    reverse: bool = False,
+) -> List[Tuple[int, Contact]]:
+    """
+    Sort the identifiers and contacts found by a query by a field, keeping the
+    order of the identifiers between equal values. Contacts without the field
+    come first, or last in reverse order.
+
+    :param found: Identifiers and contacts, in the order of the identifiers.
+    :type found: List[Tuple[int, Contact]]
+    :param order_by: Field to sort by, None to keep the order of the identifiers.
+    :type order_by: Optional[str]
+    :param reverse: Sort from the greatest value.
+    :type reverse: bool
+    """
+    if order_by is None:
+        return found
+
+    def key(x: Tuple[int, Contact]):
+        value = field_value(x[1], order_by)
+        return (value is not None, value)
+
+    return sorted(found, key=key, reverse=reverse)
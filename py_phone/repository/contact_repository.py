@@ -1,17 +1,91 @@
-from typing import Any, Generator
+from contextlib import contextmanager
+import logging
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 from py_phone.model.contact import Contact
+from py_phone.repository.contact_change import ContactChange, ContactListener
+from py_phone.repository.contact_query import Condition, check_field, order
+from py_phone.repository.field_index import FieldIndex
+from py_phone.repository.telephone_index import TelephoneIndex
 
 
 class ContactRepository:
     """
     Connect to storage for contacts.
+
+    Listeners subscribed to the repository are notified of every change, in
+    the order they happen, so an identifier is valid after the changes
+    notified before it have been applied.
+    """
+
+    newest_first = False
+    """
+    Tell if append puts the new contact first instead of last.
     """
 
     def __init__(self):
         """
         Initialize the storage for contacts.
         """
-        pass
+        self.listeners: List[ContactListener] = []
+        self.bytes_read = 0
+        """
+        Bytes read from the storage, by the backends that count them.
+        """
+
+        self.bytes_written = 0
+        """
+        Bytes written to the storage, by the backends that count them.
+        """
+
+        self.telephones: Optional[TelephoneIndex] = None
+        """
+        Index of the telephone numbers, created by the first lookup.
+        """
+
+        self.indexes: Optional[FieldIndex] = None
+        """
+        Index of the names and ages, created by the first query.
+        """
+
+    def subscribe(self, listener: ContactListener) -> None:
+        """
+        Call listener after every change to the phonebook.
+
+        :param listener: Function called with the change, the identifier and the contact.
+        :type listener: ContactListener
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: ContactListener) -> None:
+        """
+        Stop notifying changes to listener.
+        """
+        self.listeners.remove(listener)
+
+    def notify(self, change: ContactChange, id: int, c: Contact) -> None:
+        """
+        Notify a change to all the listeners.
+
+        :param change: What happened to the contact.
+        :type change: ContactChange
+        :param id: Identifier of the contact, never negative.
+        :type id: int
+        :param c: The contact inserted, updated or removed.
+        :type c: Contact
+        """
+        for listener in self.listeners:
+            try:
+                listener(change, id, c)
+            except Exception as e:
+                logging.error(f"Listener failed on {change.value} {id} due to {e}")
 
     def append(self, c: Contact) -> int:
         """
@@ -24,12 +98,27 @@ class ContactRepository:
         """
         raise NotImplementedError()
 
-    def items(self) -> Generator[Contact, Any, None]:
+    def items(
+        self, offset: int = 0, limit: Optional[int] = None
+    ) -> Generator[Contact, Any, None]:
         """
         Return a list of all items in the repository. In some implementations it may use iterators instead return the entire list at once.
+
+        Give offset and limit to read a single page of the phonebook.
+
+        :param offset: Identifier of the first contact to return.
+        :type offset: int
+        :param limit: Maximum number of contacts to return, None for all of them.
+        :type limit: Optional[int]
         """
         raise NotImplementedError()
 
+    def count(self) -> int:
+        """
+        Return the number of contacts in the repository.
+        """
+        return sum(1 for _ in self.items())
+
     def pop(self, id: int) -> Contact:
         """
         Remove the item with given id and return it.
@@ -60,3 +149,147 @@ class ContactRepository:
         :type c: Contact
         """
         raise NotImplementedError()
+
+    def find_by_telephone(self, number: str) -> List[Tuple[int, Contact]]:
+        """
+        Return the identifiers and the contacts with the given number.
+
+        Numbers are compared without spaces, punctuation and the local
+        international prefix, and a number matches a longer one ending with
+        it, so "+39 06 1234567" finds "061234567". By default the lookup uses
+        a hash index kept in sync with the changes of the repository.
+
+        :param number: Telephone number, written in any way.
+        :type number: str
+        """
+        if self.telephones is None:
+            self.telephones = TelephoneIndex(self)
+        return self.telephones.find(number)
+
+    def query(
+        self,
+        conditions: Iterable[Condition] = (),
+        order_by: Optional[str] = None,
+        reverse: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, Contact]]:
+        """
+        Return the identifiers and the contacts matching all the conditions.
+
+        By default the contacts are found with a sorted index of the names and
+        the ages, kept in sync with the changes of the repository, and only
+        the conditions on other fields scan the whole phonebook.
+
+        >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+        >>> mem = ContactMemoryRepository()
+        >>> mem.phonebook = [Contact("Mario", "Rossi", age=40), Contact("Anna", "Russo", age=30)]
+        >>> mem.query([Condition("last_name", "prefix", "R")], order_by="age", limit=1)
+        [(1, Contact("Anna", "Russo", "", "", 30))]
+
+        :param conditions: Conditions that contacts must satisfy.
+        :type conditions: Iterable[Condition]
+        :param order_by: Field to sort by, None to keep the order of the phonebook.
+        :type order_by: Optional[str]
+        :param reverse: Sort from the greatest value.
+        :type reverse: bool
+        :param offset: Number of contacts found to skip.
+        :type offset: int
+        :param limit: Maximum number of contacts to return, None for all of them.
+        :type limit: Optional[int]
+        """
+        conditions = list(conditions)
+        if order_by is not None:
+            check_field(order_by)
+        if self.indexes is None:
+            self.indexes = FieldIndex(self)
+
+        found = self.indexes.find(conditions)
+        if found is None:
+            found = [
+                (id, c)
+                for id, c in enumerate(self.items())
+                if all(x.matches(c) for x in conditions)
+            ]
+        stop = None if limit is None else offset + limit
+        return order(found, order_by, reverse)[offset:stop]
+
+    def close(self) -> None:
+        """
+        Save what is still pending and release the storage.
+        """
+
+    def refresh(self) -> None:
+        """
+        Notify the listeners of the changes made to the storage by someone
+        else, like another process or a sync tool.
+
+        Only the changed contacts are read again. The storage is compared with
+        how it was the first time it was read, so call it before reading the
+        phonebook. Contacts removed by someone else can't be read anymore, so
+        they are notified as empty contacts. By default nothing is watched.
+        """
+
+    def append_many(self, contacts: Iterable[Contact]) -> List[int]:
+        """
+        Append the contacts to the end of the phonebook, in the given order.
+
+        Backends override it to save the whole batch with a single write.
+
+        :param contacts: Contacts to save.
+        :type contacts: Iterable[Contact]
+        :return: Identifiers of the contacts after the whole batch.
+        :rtype: List[int]
+        """
+        return [self.append(c) for c in contacts]
+
+    def get_many(self, ids: Iterable[int]) -> List[Contact]:
+        """
+        Return the items with given ids, in the same order.
+
+        :param ids: Identifiers of the contacts.
+        :type ids: Iterable[int]
+        """
+        return [self.get(id) for id in ids]
+
+    def pop_many(self, ids: Iterable[int]) -> List[Contact]:
+        """
+        Remove the items with given ids and return them in the same order.
+
+        Identifiers refer to the positions before the batch, so they don't
+        move while the items are removed.
+
+        :param ids: Distinct identifiers of the contacts, counted from the start.
+        :type ids: Iterable[int]
+        """
+        ids = [id for id in ids]
+        order = sorted(set(ids), reverse=True)
+        if len(order) != len(ids):
+            raise ValueError("Can't remove the same contact twice.")
+
+        popped = {id: self.pop(id) for id in order}
+        return [popped[id] for id in ids]
+
+    def set_many(
+        self, changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+    ) -> None:
+        """
+        Update many contacts given their ids.
+
+        :param changes: New contact for each identifier.
+        :type changes: Dict[int, Contact] | Iterable[Tuple[int, Contact]]
+        """
+        for id, c in dict(changes).items():
+            self.set(id, c)
+
+    @contextmanager
+    def frozen(self):
+        """
+        Keep the phonebook still inside the block, with every change made
+        before it already notified, so a listener can read the whole phonebook
+        and then follow the changes notified after the block.
+
+        By default changes are notified as soon as they are made, so there is
+        nothing to wait for.
+        """
+        yield
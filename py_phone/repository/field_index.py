@@ -0,0 +1,221 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_change import ContactChange
+from py_phone.repository.contact_query import Condition, field_value
+from py_phone.repository.position_keys import PositionKeys
+
+
+class FieldIndex:
+    """
+    Find the contacts of a phonebook matching conditions on some fields.
+
+    The values of each indexed field are kept sorted with the key of their
+    contact, so the contacts matching a condition are found with two binary
+    searches. The index is read from the phonebook on the first lookup, then
+    kept in sync with the changes it notifies.
+
+    >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("Mario", "Rossi", age=40), Contact("Anna", "Bianchi", age=30)]
+    >>> index = FieldIndex(mem)
+    >>> index.find([Condition("age", "between", (35, 45))])
+    [(0, Contact("Mario", "Rossi", "", "", 40))]
+    >>> mem.append(Contact("Luca", "Rossini", age=38))
+    2
+    >>> [id for id, _ in index.find([Condition("last_name", "prefix", "Ross")])]
+    [0, 2]
+    >>> index.find([Condition("address", "=", "")]) is None
+    True
+    """
+
+    def __init__(
+        self,
+        phonebook,
+        fields: Iterable[str] = ("first_name", "last_name", "age"),
+    ):
+        """
+        Create an index of some fields of phonebook.
+
+        :param phonebook: Repository to index.
+        :type phonebook: ContactRepository
+        :param fields: Fields to index.
+        :type fields: Iterable[str]
+        """
+        self.phonebook = phonebook
+        self.fields = tuple(fields)
+        self.lock = threading.RLock()
+        self.ready = False
+        self.keys = PositionKeys(self.renumbered)
+
+        self.rows: List[tuple] = []
+        """
+        Indexed values of each contact, in the order of the phonebook.
+        """
+
+        self.values: Dict[str, list] = {field: [] for field in self.fields}
+        """
+        Values of each field, sorted. Missing values are not indexed.
+        """
+
+        self.owners: Dict[str, array] = {field: array("q") for field in self.fields}
+        """
+        Key of the contact of each value.
+        """
+
+        self.phonebook.subscribe(self.change)
+
+    def row(self, c: Contact) -> tuple:
+        return tuple(field_value(c, field) for field in self.fields)
+
+    def load(self) -> None:
+        """
+        Index all the contacts in the phonebook again.
+        """
+        with self.phonebook.frozen():
+            rows = [self.row(c) for c in self.phonebook.items()]
+            with self.lock:
+                self.rows = rows
+                self.keys.reset(len(self.rows))
+                for i, field in enumerate(self.fields):
+                    pairs = sorted(
+                        (row[i], self.keys[id])
+                        for id, row in enumerate(self.rows)
+                        if row[i] is not None
+                    )
+                    self.values[field] = [value for value, _ in pairs]
+                    self.owners[field] = array("q", (key for _, key in pairs))
+                self.ready = True
+        logging.info(f"Indexed {len(rows)} contacts by {self.fields}")
+
+    def add(self, row: tuple, key: int) -> None:
+        for field, value in zip(self.fields, row):
+            if value is not None:
+                i = bisect_right(self.values[field], value)
+                self.values[field].insert(i, value)
+                self.owners[field].insert(i, key)
+
+    def discard(self, row: tuple, key: int) -> None:
+        for field, value in zip(self.fields, row):
+            if value is None:
+                continue
+            values, owners = self.values[field], self.owners[field]
+            i = bisect_left(values, value)
+            while owners[i] != key:
+                i += 1
+            del values[i]
+            del owners[i]
+
+    def renumbered(self, renamed: Dict[int, int]) -> None:
+        for field, owners in self.owners.items():
+            self.owners[field] = array("q", (renamed[key] for key in owners))
+
+    def change(self, change: ContactChange, id: int, c: Contact) -> None:
+        """
+        Update the index with a change of the phonebook.
+        """
+        with self.lock:
+            if not self.ready:
+                return
+
+            if change == ContactChange.INSERTED:
+                self.rows.insert(id, self.row(c))
+                self.add(self.rows[id], self.keys.insert(id))
+            elif change == ContactChange.UPDATED:
+                self.discard(self.rows[id], self.keys[id])
+                self.rows[id] = self.row(c)
+                self.add(self.rows[id], self.keys[id])
+            else:
+                self.discard(self.rows.pop(id), self.keys.remove(id))
+
+    def bounds(self, condition: Condition) -> Optional[Tuple[int, int]]:
+        """
+        Return the range of the sorted values of a field matching condition,
+        None if the index can't be used for it.
+        """
+        if condition.field not in self.values or condition.operator == "contains":
+            return None
+
+        values, value = self.values[condition.field], condition.value
+        operator = condition.operator
+        if operator == "=":
+            return bisect_left(values, value), bisect_right(values, value)
+        if operator == "<":
+            return 0, bisect_left(values, value)
+        if operator == "<=":
+            return 0, bisect_right(values, value)
+        if operator == ">":
+            return bisect_right(values, value), len(values)
+        if operator == ">=":
+            return bisect_left(values, value), len(values)
+        if operator == "between":
+            low = bisect_left(values, value[0])
+            return low, max(low, bisect_right(values, value[1]))
+        if not value:
+            return 0, len(values)
+        # The first string after all the ones starting with the prefix.
+        end = value[:-1] + chr(ord(value[-1]) + 1)
+        low = bisect_left(values, value)
+        return low, bisect_left(values, end, low)
+
+    def plan(self, conditions: List[Condition]) -> Optional[Condition]:
+        """
+        Return the condition matching the fewest contacts among the ones the
+        index can be used for, None if there is none.
+        """
+        if not self.ready:
+            self.load()
+
+        with self.lock:
+            best, size = None, 0
+            for condition in conditions:
+                found = self.bounds(condition)
+                if found is not None and (best is None or found[1] - found[0] < size):
+                    best, size = condition, found[1] - found[0]
+            return best
+
+    def positions(self, condition: Condition) -> List[int]:
+        """
+        Return the positions of the contacts matching a condition the index can
+        be used for, in order.
+        """
+        with self.lock:
+            low, high = self.bounds(condition)
+            owners = self.owners[condition.field]
+            return sorted(self.keys.position(owners[i]) for i in range(low, high))
+
+    def find(self, conditions: List[Condition]) -> Optional[List[Tuple[int, Contact]]]:
+        """
+        Return the positions and the contacts matching all the conditions,
+        None if the index can't be used for any of them.
+
+        Only the contacts matching the most selective condition are read from
+        the phonebook and checked against the others. If one of them doesn't
+        match that condition, the phonebook has been changed without
+        notifying the index, so the index is read again. The lock of the index
+        isn't held while reading, since the phonebook may need it to notify
+        its changes, but the phonebook is kept frozen.
+
+        :param conditions: Conditions that contacts must satisfy.
+        :type conditions: List[Condition]
+        """
+        for _ in range(2):
+            best = self.plan(conditions)
+            if best is None:
+                return None
+            with self.phonebook.frozen():
+                ids = self.positions(best)
+                contacts = self.phonebook.get_many(ids)
+            if all(best.matches(c) for c in contacts):
+                break
+            self.ready = False
+
+        return [
+            (id, c)
+            for id, c in zip(ids, contacts)
+            if all(x.matches(c) for x in conditions)
+        ]
@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Optional
+
+
+class PositionKeys:
+    """
+    Give each contact of a phonebook a key that grows with its position.
+
+    An index can save keys instead of positions, so its entries don't change
+    when the contacts before them are inserted or removed, and find the
+    position of a key with a binary search.
+
+    >>> keys = PositionKeys()
+    >>> keys.reset(2)
+    >>> a, b = keys[0], keys[1]
+    >>> c = keys.insert(0)
+    >>> keys.position(a), keys.position(b), keys.position(c)
+    (1, 2, 0)
+    >>> keys.remove(1) == a
+    True
+    >>> keys.position(b)
+    1
+    """
+
+    gap = 1 << 16
+    """
+    Distance between the keys of contacts added at the ends.
+    """
+
+    def __init__(self, renumbered: Optional[Callable[[Dict[int, int]], None]] = None):
+        """
+        :param renumbered: Called with the new key of each old one, when there is
+            no room for a key and they're all spread again.
+        :type renumbered: Optional[Callable[[Dict[int, int]], None]]
+        """
+        self.keys = array("q")
+        self.renumbered = renumbered
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, id: int) -> int:
+        return self.keys[id]
+
+    def reset(self, count: int) -> None:
+        """
+        Give new keys to count contacts.
+        """
+        self.keys = array("q", range(0, count * self.gap, self.gap))
+
+    def insert(self, id: int) -> int:
+        """
+        Add a key for a contact inserted at the given position and return it.
+        """
+        keys = self.keys
+        if not keys:
+            key = 0
+        elif id >= len(keys):
+            key = keys[-1] + self.gap
+        elif id == 0:
+            key = keys[0] - self.gap
+        else:
+            if keys[id] - keys[id - 1] < 2:
+                self.renumber()
+                keys = self.keys
+            key = (keys[id - 1] + keys[id]) // 2
+
+        keys.insert(id, key)
+        return key
+
+    def remove(self, id: int) -> int:
+        """
+        Remove the key of the contact at the given position and return it.
+        """
+        key = self.keys[id]
+        del self.keys[id]
+        return key
+
+    def position(self, key: int) -> int:
+        """
+        Return the position of the contact with the given key.
+        """
+        return bisect_left(self.keys, key)
+
+    def renumber(self) -> None:
+        """
+        Spread the keys again, when there is no room between two of them.
+        """
+        renamed = {key: i * self.gap for i, key in enumerate(self.keys)}
+        self.keys = array("q", (renamed[key] for key in self.keys))
+        if self.renumbered:
+            self.renumbered(renamed)
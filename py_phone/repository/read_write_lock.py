@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+import threading
+from typing import Optional
+
+
+class ReadWriteLock:
+    """
+    A lock held by many readers together or by a single writer.
+
+    Waiting writers get the lock before new readers, so a stream of reads
+    can't starve them. The writer can take the lock again, to read or write,
+    and so can a thread that is already reading, so listeners notified while
+    the lock is held can read the repository.
+
+    >>> lock = ReadWriteLock()
+    >>> with lock.read(), lock.read():
+    ...     lock.readers
+    2
+    >>> with lock.write(), lock.read(), lock.write():
+    ...     lock.writer == threading.get_ident()
+    True
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.waiting = 0
+        self.writer: Optional[int] = None
+        """
+        Identifier of the thread holding the lock to write.
+        """
+
+        self.depth = 0
+        self.local = threading.local()
+
+    @contextmanager
+    def read(self):
+        """
+        Hold the lock to read inside the block.
+        """
+        me = threading.get_ident()
+        reading = getattr(self.local, "reading", 0)
+        with self.condition:
+            if self.writer != me and not reading:
+                while self.writer is not None or self.waiting:
+                    self.condition.wait()
+            self.readers += 1
+        self.local.reading = reading + 1
+        try:
+            yield
+        finally:
+            self.local.reading = reading
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """
+        Hold the lock to write inside the block.
+        """
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer != me:
+                if getattr(self.local, "reading", 0):
+                    raise RuntimeError("Can't write while reading.")
+                self.waiting += 1
+                while self.writer is not None or self.readers:
+                    self.condition.wait()
+                self.waiting -= 1
+                self.writer = me
+            self.depth += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.depth -= 1
+                if not self.depth:
+                    self.writer = None
+                    self.condition.notify_all()
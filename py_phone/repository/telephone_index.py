@@ -0,0 +1,149 @@
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.model.telephone import (
+    normalize_telephone,
+    telephone_key,
+    telephones_match,
+)
+from py_phone.repository.contact_change import ContactChange
+from py_phone.repository.position_keys import PositionKeys
+
+
+class TelephoneIndex:
+    """
+    Find the contacts of a phonebook with a given telephone number.
+
+    Numbers are normalized and grouped by their final digits in a hash table,
+    so a lookup only compares the few numbers with the same final digits. The
+    index is read from the phonebook on the first lookup, then kept in sync
+    with the changes it notifies.
+
+    >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("Mario", "Rossi", "", "06 1234567"), Contact("Anna")]
+    >>> index = TelephoneIndex(mem)
+    >>> index.find("+39 061234567")
+    [(0, Contact("Mario", "Rossi", "", "06 1234567", None))]
+    >>> mem.set(1, Contact("Anna", "Bianchi", "", "333 7654321"))
+    >>> index.find("3337654321")
+    [(1, Contact("Anna", "Bianchi", "", "333 7654321", None))]
+    """
+
+    def __init__(self, phonebook):
+        """
+        Create an index of the numbers in phonebook.
+
+        :param phonebook: Repository to index.
+        :type phonebook: ContactRepository
+        """
+        self.phonebook = phonebook
+        self.lock = threading.RLock()
+        self.ready = False
+        self.keys = PositionKeys(self.renumbered)
+
+        self.numbers: List[str] = []
+        """
+        Normalized number of each contact, in the order of the phonebook.
+        """
+
+        self.buckets: Dict[str, List[int]] = {}
+        """
+        Keys of the contacts, by the final digits of their number.
+        """
+
+        self.phonebook.subscribe(self.change)
+
+    def load(self) -> None:
+        """
+        Index all the numbers in the phonebook again.
+        """
+        with self.phonebook.frozen():
+            numbers = [normalize_telephone(c.telephone) for c in self.phonebook.items()]
+            with self.lock:
+                self.numbers = numbers
+                self.keys.reset(len(self.numbers))
+                self.buckets = {}
+                for i, number in enumerate(self.numbers):
+                    self.add(number, self.keys[i])
+                self.ready = True
+        logging.info(f"Indexed {len(numbers)} telephone numbers")
+
+    def add(self, number: str, key: int) -> None:
+        if number:
+            self.buckets.setdefault(telephone_key(number), []).append(key)
+
+    def discard(self, number: str, key: int) -> None:
+        if number:
+            bucket = self.buckets[telephone_key(number)]
+            bucket.remove(key)
+            if not bucket:
+                del self.buckets[telephone_key(number)]
+
+    def renumbered(self, renamed: Dict[int, int]) -> None:
+        for bucket in self.buckets.values():
+            bucket[:] = [renamed[key] for key in bucket]
+
+    def change(self, change: ContactChange, id: int, c: Contact) -> None:
+        """
+        Update the index with a change of the phonebook.
+        """
+        with self.lock:
+            if not self.ready:
+                return
+
+            if change == ContactChange.INSERTED:
+                number = normalize_telephone(c.telephone)
+                self.numbers.insert(id, number)
+                self.add(number, self.keys.insert(id))
+            elif change == ContactChange.UPDATED:
+                self.discard(self.numbers[id], self.keys[id])
+                self.numbers[id] = normalize_telephone(c.telephone)
+                self.add(self.numbers[id], self.keys[id])
+            else:
+                self.discard(self.numbers.pop(id), self.keys.remove(id))
+
+    def positions(self, number: str) -> List[int]:
+        """
+        Return the positions of the contacts whose number matches the given
+        normalized one, in order.
+        """
+        if not self.ready:
+            self.load()
+
+        with self.lock:
+            bucket = self.buckets.get(telephone_key(number), [])
+            positions = [self.keys.position(key) for key in bucket]
+            return sorted(
+                i for i in positions if telephones_match(self.numbers[i], number)
+            )
+
+    def find(self, number: str) -> List[Tuple[int, Contact]]:
+        """
+        Return the positions and the contacts with the given number.
+
+        Contacts are read from the phonebook and checked again, so if it has
+        been changed without notifying the index, the index is read again.
+        The lock of the index isn't held while reading, since the phonebook
+        may need it to notify its changes, but the phonebook is kept frozen.
+
+        :param number: Telephone number, written in any way.
+        :type number: str
+        """
+        number = normalize_telephone(number)
+        if not number:
+            return []
+
+        for _ in range(2):
+            with self.phonebook.frozen():
+                ids = self.positions(number)
+                found = [x for x in zip(ids, self.phonebook.get_many(ids))]
+            if all(
+                telephones_match(normalize_telephone(c.telephone), number)
+                for _, c in found
+            ):
+                return found
+            self.ready = False
+        return found
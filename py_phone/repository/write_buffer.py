@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+from typing import Callable, Iterable, List, Optional
+
+from py_phone.model.contact import Contact
+
+fsync_policies = ("none", "batch", "write")
+"""
+When data is forced to the disk: never, once for each batch of writes, or
+after every single write.
+"""
+
+
+class WriteBuffer:
+    """
+    Collect the contacts appended to a repository and write them together.
+
+    Contacts are written when max_pending of them are waiting, when the
+    oldest has waited delay seconds, or when flush is called. The repository
+    must flush before reading, so it reads back what has been appended.
+
+    With a delay, the contacts are written by a timer thread, while the
+    repository doesn't lock its own state. Flushing before every operation
+    makes it wait for the timer, so a single thread at a time can use the
+    repository, like the worker of the PhonebookService. A failed timed
+    write is logged and the contacts wait for the next flush.
+
+    >>> written = []
+    >>> buffer = WriteBuffer(written.append, max_pending=2)
+    >>> buffer.add(Contact("primo"))
+    >>> written
+    []
+    >>> buffer.add(Contact("secondo"))
+    >>> [len(x) for x in written]
+    [2]
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Contact]], None],
+        max_pending: int = 1,
+        delay: float = 0.0,
+    ):
+        """
+        :param write: Write a batch of contacts in the repository.
+        :type write: Callable[[List[Contact]], None]
+        :param max_pending: Contacts waiting that trigger a write, 1 to write
+            every contact as soon as it's appended.
+        :type max_pending: int
+        :param delay: Seconds after which waiting contacts are written, 0 to
+            wait for max_pending contacts or a flush.
+        :type delay: float
+        """
+        self.write = write
+        self.max_pending = max_pending
+        self.delay = delay
+        self.lock = threading.RLock()
+        self.pending: List[Contact] = []
+        self.timer: Optional[threading.Timer] = None
+
+    def add(self, c: Contact) -> None:
+        """
+        Add a contact to the ones waiting to be written.
+        """
+        with self.lock:
+            self.pending.append(c)
+            if len(self.pending) >= self.max_pending:
+                self.flush()
+            elif self.delay > 0 and self.timer is None:
+                self.timer = threading.Timer(self.delay, self.timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        """
+        Write all the contacts waiting.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            logging.debug("Writing %d buffered contacts", len(batch))
+            try:
+                self.write(batch)
+            except Exception:
+                # Keep them for the next flush, in the order they came.
+                self.pending = batch + self.pending
+                raise
+
+    def timed_flush(self) -> None:
+        """
+        Write the contacts waiting from the timer thread, where an error would
+        be lost, so it's logged instead.
+        """
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(
+                f"Can't write {len(self.pending)} buffered contacts due to {e}"
+            )
+
+
+def fsync_paths(paths: Iterable[str]) -> None:
+    """
+    Force the given files to the disk, then the folders containing them, so
+    new files aren't lost either.
+    """
+    folders = set()
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        folders.add(os.path.dirname(os.path.abspath(path)))
+
+    for folder in folders:
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
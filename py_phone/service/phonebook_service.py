@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import tkinter
+from typing import Any, Callable, List, Optional
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_repository import ContactListener, ContactRepository
+
+
+class PhonebookService:
+    """
+    Run the calls to the phonebook on a worker thread, so the Tk mainloop never
+    waits for the storage.
+
+    Calls run one at a time in the order they are submitted, so edits are never
+    reordered. Results, errors and change notifications are given back to the
+    Tk thread in the same order, polling a queue with root.after.
+    """
+
+    def __init__(
+        self, root: tkinter.Misc, phonebook: ContactRepository, interval: int = 20
+    ):
+        """
+        Start the worker and the polling of the results.
+
+        :param root: Widget used to schedule the polling on the Tk thread.
+        :type root: tkinter.Misc
+        :param phonebook: Repository called by the worker.
+        :type phonebook: ContactRepository
+        :param interval: Milliseconds between two polls of the results.
+        :type interval: int
+        """
+        self.root = root
+        self.phonebook = phonebook
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(1, "phonebook-worker")
+        self.results: queue.SimpleQueue = queue.SimpleQueue()
+        self.pending = 0
+        """
+        Number of calls submitted whose result has not been delivered yet.
+        """
+
+        self.root.after(self.interval, self.poll)
+
+    def submit(
+        self,
+        call: Callable[[], Any],
+        done: Optional[Callable[[Any], None]] = None,
+        failed: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        """
+        Run call on the worker, then done with its result on the Tk thread.
+
+        :param call: Function accessing the phonebook.
+        :type call: Callable[[], Any]
+        :param done: Called with the result of call.
+        :type done: Optional[Callable[[Any], None]]
+        :param failed: Called with the exception raised by call.
+        :type failed: Optional[Callable[[Exception], None]]
+        """
+
+        def run():
+            try:
+                self.results.put((done, call(), True))
+            except Exception as e:
+                logging.error(f"Phonebook call failed due to {e}")
+                self.results.put((failed, e, True))
+
+        self.pending += 1
+        self.executor.submit(run)
+
+    def post(self, callback: Callable[..., None], *args) -> None:
+        """
+        Call callback on the Tk thread, after the results already queued.
+        """
+        self.results.put((lambda a: callback(*a), args, False))
+
+    def poll(self) -> None:
+        """
+        Deliver the results of the finished calls on the Tk thread.
+        """
+        while True:
+            try:
+                callback, value, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if result:
+                self.pending -= 1
+            if callback:
+                try:
+                    callback(value)
+                except Exception as e:
+                    logging.error(f"Phonebook callback failed due to {e}")
+
+        self.root.after(self.interval, self.poll)
+
+    def subscribe(self, listener: ContactListener) -> None:
+        """
+        Notify the changes of the phonebook to listener on the Tk thread.
+        """
+        self.phonebook.subscribe(lambda *change: self.post(listener, *change))
+
+    def watch(self, interval: int) -> None:
+        """
+        Look for the changes made to the phonebook by someone else now, then
+        again interval milliseconds after each look is done.
+        """
+
+        def again(_):
+            self.root.after(interval, lambda: self.watch(interval))
+
+        self.submit(self.phonebook.refresh, again, again)
+
+    def page(
+        self, offset: int, limit: int, done: Callable[[List[Contact]], None]
+    ) -> None:
+        self.submit(lambda: [c for c in self.phonebook.items(offset, limit)], done)
+
+    def get(
+        self,
+        id: int,
+        done: Callable[[Contact], None],
+        failed: Optional[Callable[[Exception], None]] = None,
+    ) -> None:
+        self.submit(lambda: self.phonebook.get(id), done, failed)
+
+    def append(self, c: Contact, done: Optional[Callable[[int], None]] = None):
+        self.submit(lambda: self.phonebook.append(c), done)
+
+    def set(self, id: int, c: Contact, done: Optional[Callable[[Any], None]] = None):
+        self.submit(lambda: self.phonebook.set(id, c), done)
+
+    def pop(self, id: int, done: Optional[Callable[[Contact], None]] = None):
+        self.submit(lambda: self.phonebook.pop(id), done)
+
+    def close(self) -> None:
+        """
+        Wait for the queued edits to be saved and stop the worker.
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,194 @@
+from array import array
+from bisect import bisect_left
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+from py_phone.model.contact import Contact
+from py_phone.repository.contact_repository import ContactChange, ContactRepository
+from py_phone.repository.position_keys import PositionKeys
+
+
+class SearchService:
+    """
+    Find contacts by the prefix of their name or telephone number.
+
+    The terms of every contact, "first last", "last first" and the digits of
+    the telephone, are kept in a sorted list, so a prefix is found with a
+    binary search. The index is kept in sync with the changes notified by the
+    phonebook.
+
+    Each contact has a key that grows with its position, so the position of a
+    key is found with a binary search too, and the terms don't change when
+    the contacts before them are inserted or removed.
+
+    >>> from py_phone.repository.contact_memory_repository import ContactMemoryRepository
+    >>> mem = ContactMemoryRepository()
+    >>> mem.phonebook = [Contact("Mario", "Rossi", "", "06 1234"), Contact("Anna", "Bianchi")]
+    >>> search = SearchService(mem)
+    >>> search.load()
+    >>> search.search("ross")
+    [0]
+    >>> mem.append(Contact("Marco", "Verdi", "", "333 444"))
+    2
+    >>> mem.pop(0)
+    Contact("Mario", "Rossi", "", "06 1234", None)
+    >>> search.search("mar"), search.search("333"), search.search("Bianchi Anna")
+    ([1], [1], [0])
+    """
+
+    def __init__(self, phonebook: ContactRepository):
+        """
+        Create an empty index, following the changes of phonebook.
+
+        Call load to index the contacts already in the phonebook.
+
+        :param phonebook: Repository to index.
+        :type phonebook: ContactRepository
+        """
+        self.phonebook = phonebook
+        self.lock = threading.RLock()
+        self.ready = False
+
+        self.keys = PositionKeys(self.renumbered)
+        """
+        Key of each contact, in the order of the phonebook.
+        """
+
+        self.entries: List[Tuple[str, ...]] = []
+        """
+        Terms of each contact, in the order of the phonebook.
+        """
+
+        self.terms: List[str] = []
+        """
+        Terms of all the contacts, sorted.
+        """
+
+        self.owners = array("q")
+        """
+        Key of the contact of each term.
+        """
+
+        self.phonebook.subscribe(self.change)
+
+    def normalize(self, text: str) -> str:
+        """
+        Return text lower case, with single spaces between the words.
+        """
+        return " ".join(text.casefold().split())
+
+    def digits(self, text: str) -> str:
+        """
+        Return only the digits of text.
+        """
+        return "".join(x for x in text if x.isdigit())
+
+    def contact_terms(self, c: Contact) -> Tuple[str, ...]:
+        """
+        Return the distinct terms indexed for a contact.
+        """
+        first, last = str(c.first_name), str(c.last_name)
+        terms = {
+            self.normalize(f"{first} {last}"),
+            self.normalize(f"{last} {first}"),
+            self.digits(str(c.telephone)),
+        }
+        terms.discard("")
+        return tuple(terms)
+
+    def load(self) -> None:
+        """
+        Index all the contacts in the phonebook again.
+        """
+        with self.phonebook.frozen():
+            entries = [self.contact_terms(c) for c in self.phonebook.items()]
+            with self.lock:
+                self.entries = entries
+                self.keys.reset(len(self.entries))
+                pairs = []
+                for i, terms in enumerate(self.entries):
+                    pairs.extend((term, self.keys[i]) for term in terms)
+
+                pairs.sort()
+                self.terms = [term for term, _ in pairs]
+                self.owners = array("q", (key for _, key in pairs))
+                self.ready = True
+        logging.info(f"Indexed {len(entries)} contacts for search")
+
+    def change(self, change: ContactChange, id: int, c: Contact) -> None:
+        """
+        Update the index with a change of the phonebook.
+        """
+        with self.lock:
+            if not self.ready:
+                return
+
+            if change == ContactChange.INSERTED:
+                key = self.keys.insert(id)
+                self.entries.insert(id, self.contact_terms(c))
+                self.add_terms(self.entries[id], key)
+            elif change == ContactChange.UPDATED:
+                key = self.keys[id]
+                self.remove_terms(self.entries[id], key)
+                self.entries[id] = self.contact_terms(c)
+                self.add_terms(self.entries[id], key)
+            else:
+                self.remove_terms(self.entries.pop(id), self.keys.remove(id))
+
+    def renumbered(self, renamed: Dict[int, int]) -> None:
+        self.owners = array("q", (renamed[key] for key in self.owners))
+
+    def add_terms(self, terms: Tuple[str, ...], key: int) -> None:
+        for term in terms:
+            i = bisect_left(self.terms, term)
+            self.terms.insert(i, term)
+            self.owners.insert(i, key)
+
+    def remove_terms(self, terms: Tuple[str, ...], key: int) -> None:
+        for term in terms:
+            i = bisect_left(self.terms, term)
+            while i < len(self.terms) and self.terms[i] == term:
+                if self.owners[i] == key:
+                    del self.terms[i]
+                    del self.owners[i]
+                    break
+                i += 1
+
+    def search(self, query: str, limit: int = 100) -> List[int]:
+        """
+        Return the positions of the contacts with a term starting with query,
+        in the alphabetical order of the terms.
+
+        :param query: Start of the name, surname or telephone number.
+        :type query: str
+        :param limit: Maximum number of positions to return.
+        :type limit: int
+        """
+        prefixes = {self.normalize(query), self.digits(query)}
+        prefixes.discard("")
+        with self.lock:
+            found = {}
+            for prefix in sorted(prefixes):
+                # The first string after all the ones starting with prefix.
+                end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                lo = bisect_left(self.terms, prefix)
+                hi = bisect_left(self.terms, end, lo)
+                for i in range(lo, hi):
+                    if len(found) >= limit:
+                        break
+                    found.setdefault(self.owners[i], None)
+
+            return [self.keys.position(key) for key in found]
+
+    def find(self, query: str, limit: int = 100) -> List[Tuple[int, Contact]]:
+        """
+        Return the positions and the contacts matching query, read from the
+        phonebook.
+
+        The lock of the index isn't held while reading, since the phonebook may
+        need it to notify its changes, but the phonebook is kept frozen.
+        """
+        with self.phonebook.frozen():
+            ids = self.search(query, limit)
+            return [x for x in zip(ids, self.phonebook.get_many(ids))]
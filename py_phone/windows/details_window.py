@@ -4,7 +4,7 @@ import tkinter
 from typing import Optional
 
 from py_phone.model.contact import Contact
-from py_phone.repository.contact_repository import ContactRepository
+from py_phone.service.phonebook_service import PhonebookService
 from py_phone.utils import control
 
 
@@ -26,36 +26,26 @@ class DetailContactWindow:
     def __init__(
         self,
         root: tkinter.Toplevel,
-        phonebook: ContactRepository,
+        phonebook: PhonebookService,
         id: Optional[int] = None,
     ):
         """
         Initialize the window, showing info about contact if passed as param.
+
+        The contact is read in background, saving is enabled once it's shown.
         """
         self.id = id
         self.phonebook = phonebook
-        self.contact = Contact() if id is None else self.phonebook.get(id)
-        logging.info(f"Ho caricato il contatto {self.contact.first_name} a {self.id}")
+        self.contact = Contact()
 
         self.root = root
         root.title("Nuovo contatto")
 
         self.ent_firstname = control(root, "Nome > ", 0)
-        self.ent_firstname.insert(0, self.contact.first_name)
-
         self.ent_lastname = control(root, "Cognome > ", 1)
-        self.ent_lastname.insert(0, self.contact.last_name)
-
         self.ent_telephone = control(root, "Tel > ", 2)
-        self.ent_telephone.insert(0, self.contact.telephone)
-
         self.ent_address = control(root, "Indirizzo > ", 3)
-        self.ent_address.insert(0, self.contact.address)
-
         self.ent_age = control(root, "Età > ", 4)
-        given_age = self.contact.age or ""
-        logging.info(f"Loading age {given_age} from {self.contact.age}.")
-        self.ent_age.insert(0, given_age)
         self.ent_age.configure(validatecommand=self.validate_age, validate="focus")
 
         self.lbl_error = tkinter.Label(root, text="Error frame")
@@ -68,6 +58,42 @@ class DetailContactWindow:
         self.delete_btn = tkinter.Button(root, text="Annulla", command=self.cancel)
         self.delete_btn.grid(row=5, column=1, padx=5, pady=5)
 
+        if id is not None:
+            self.add_btn.configure(state=tkinter.DISABLED)
+            self.lbl_error.config(text="Caricamento...")
+            self.phonebook.get(id, self.show_contact, self.show_error)
+
+    def show_contact(self, contact: Contact):
+        """
+        Fill the fields with the info of the contact.
+        """
+        if not self.root.winfo_exists():
+            return
+
+        self.contact = contact
+        logging.info(f"Ho caricato il contatto {self.contact.first_name} a {self.id}")
+        self.reset()
+        self.ent_firstname.insert(0, self.contact.first_name)
+        self.ent_lastname.insert(0, self.contact.last_name)
+        self.ent_telephone.insert(0, self.contact.telephone)
+        self.ent_address.insert(0, self.contact.address)
+        given_age = self.contact.age or ""
+        logging.info(f"Loading age {given_age} from {self.contact.age}.")
+        self.ent_age.insert(0, given_age)
+        self.lbl_error.config(text="")
+        self.add_btn.configure(state=tkinter.NORMAL)
+
+    def show_error(self, e: Exception):
+        """
+        Tell the contact can't be read, for example because someone else
+        removed it, and close the window.
+        """
+        if not self.root.winfo_exists():
+            return
+
+        messagebox.showerror("Errore", f"Non riesco a leggere il contatto: {e}")
+        self.root.destroy()
+
     def validate_age(self):
         age = self.ent_age.get()
         logging.debug(f"Validating age using {age} as value")